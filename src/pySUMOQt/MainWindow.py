@@ -430,15 +430,16 @@ class MainWindow(Ui_mainwindow, QMainWindow):
         QT Slot which handles the open local ontology action when it is triggered.
         """
         defPath = self.getDefaultOutputPath()
-        x, y = QFileDialog.getOpenFileName(self, "Open Ontology File",
+        x, y = QFileDialog.getOpenFileNames(self, "Open Ontology Files",
                                                 defPath, "SUO KIF Files (*.kif)")
-        if x == '' and y == '':
+        if len(x) == 0:
             return
-        filepath = x
-        filename = os.path.split(filepath)[1]
-        filename = os.path.splitext(filename)[0]
-        ontology = Ontology(filepath, filename)
-        self.addOntology(ontology)
+        ontologies = list()
+        for filepath in x:
+            filename = os.path.split(filepath)[1]
+            filename = os.path.splitext(filename)[0]
+            ontologies.append(Ontology(filepath, filename))
+        self.addOntologies(ontologies)
 
     def _openRemoteOntology_(self):
         """
@@ -460,6 +461,18 @@ class MainWindow(Ui_mainwindow, QMainWindow):
         RWWidget.SyntaxController.add_ontology(ontology, newversion)
         self.ontologyAdded.emit(ontology)
         
+    def addOntologies(self, ontologies):
+        """
+        Adds several ontologies to index at once and notify all components required.
+        
+        Parameter :
+        
+        - ontologies : The list of ontologies to add.
+        """
+        RWWidget.SyntaxController.add_ontologies(ontologies)
+        for ontology in ontologies:
+            self.ontologyAdded.emit(ontology)
+        
     def addRecentOntology(self, ontology):
         count = len(self.menuRecent_Ontologies.actions())
         count = count - 2  # remove the separator action and the clear history action.
@@ -141,7 +141,7 @@ class TextEditor(RWWidget, Ui_Form):
         if self.canUndo:
             self.plainTextEdit.undo()
             try:
-                self.SyntaxController.add_ontology(self.getActiveOntology(), self.plainTextEdit.toPlainText())
+                self.SyntaxController.parse_edit(self.getActiveOntology(), self.plainTextEdit.toPlainText())
             except ParseError:
                 return
             self.commit()
@@ -152,7 +152,7 @@ class TextEditor(RWWidget, Ui_Form):
         if self.canRedo:
             self.plainTextEdit.redo()
             try:
-                self.SyntaxController.add_ontology(self.getActiveOntology(), self.plainTextEdit.toPlainText())
+                self.SyntaxController.parse_edit(self.getActiveOntology(), self.plainTextEdit.toPlainText())
             except ParseError:
                 return
             self.commit()
@@ -473,9 +473,13 @@ class TextEditor(RWWidget, Ui_Form):
             return
         try:
             QApplication.setOverrideCursor(Qt.BusyCursor)
-            self.SyntaxController.add_ontology(ontology, self.plainTextEdit.toPlainText())
+            self.SyntaxController.parse_edit(ontology, self.plainTextEdit.toPlainText())
             QApplication.setOverrideCursor(Qt.ArrowCursor)
         except ParseError:
+            QApplication.setOverrideCursor(Qt.ArrowCursor)
+            _, errors = self.SyntaxController.validate(self.plainTextEdit.toPlainText(), ontology)
+            for error in errors:
+                self.log.error(str(error))
             return
         super(TextEditor, self).commit()
         
@@ -0,0 +1,149 @@
+""" The on-disk cache of parsed Ontologies. Parsing a large kif file is by far
+the most expensive part of loading it, so the AST of every file that is parsed
+is stored under the hash of its content and reused as long as neither the file
+nor the parser changes.
+
+This module contains:
+
+- ASTCache: A size-limited directory of serialized ASTs.
+
+"""
+
+import hashlib
+import logging
+import os
+
+from tempfile import mkstemp
+
+from pysumo import CONFIG_PATH
+from . import parser
+
+class ASTCache:
+    """ A directory of ASTs serialized with parser.astdumps. Entries are keyed
+    by the SHA-256 of the kif file's content, the parser's VERSION and the
+    node type, so that stale entries are never loaded. When the directory
+    grows beyond max_size bytes, the least recently used entries are removed.
+
+    Variables:
+
+    - default_path: The default location of the cache.
+    - max_size: The maximum size of the cache in bytes.
+    - path: The location of the cache.
+
+    Methods:
+
+    - load: Returns the cached AST of a kif file or None.
+    - store: Adds the AST of a kif file to the cache.
+    - clear: Removes all entries from the cache.
+
+    """
+
+    default_path = '/'.join([CONFIG_PATH, 'astcache'])
+    max_size = 64 * 1024 * 1024
+
+    def __init__(self, path=None):
+        """ Initializes the cache and creates its directory. """
+        self.path = path if path is not None else self.default_path
+        self.log = logging.getLogger('.' + __name__)
+        try:
+            os.makedirs(self.path, exist_ok=True)
+        except PermissionError:
+            self.path = self.default_path
+            os.makedirs(self.path, exist_ok=True)
+
+    def _entry(self, data, compact):
+        """ Returns the path of the entry for the kif file content data. """
+        key = hashlib.sha256(data).hexdigest()
+        suffix = 'c' if compact else 'n'
+        return '/'.join([self.path, '%s-%d%s.ast' % (key, parser.VERSION, suffix)])
+
+    def load(self, data, ontology, compact=False, source=None):
+        """ Returns the cached AST of the kif file content data.
+
+        Args:
+
+        - data: the content of the kif file as bytes
+        - ontology: the Ontology to which the AST belongs
+        - compact: build the tree out of CompactAbstractSyntaxTree nodes
+        - source: the content the AST was parsed from, restores the spans of the statements
+
+        Returns:
+
+        - AbstractSyntaxTree or None if data is not cached
+
+        """
+        entry = self._entry(data, compact)
+        try:
+            with open(entry, 'rb') as f:
+                ast = parser.astloads(f.read(), ontology, compact, source)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            self.log.warning('Removing corrupt cache entry %s' % entry)
+            self._remove(entry)
+            return None
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return ast
+
+    def store(self, data, ast, compact=False):
+        """ Adds the AST of the kif file content data to the cache. Errors
+        are logged as the cache is only an optimization.
+
+        Args:
+
+        - data: the content of the kif file as bytes
+        - ast: the AST returned by kifparse for data or its serialization by parser.astdumps
+        - compact: whether ast consists of CompactAbstractSyntaxTree nodes
+
+        """
+        entry = self._entry(data, compact)
+        tmp = None
+        try:
+            fd, tmp = mkstemp(dir=self.path, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(ast if isinstance(ast, bytes) else parser.astdumps(ast))
+            os.replace(tmp, entry)
+        except Exception as err:
+            self.log.warning('Could not cache AST: %s' % err)
+            if tmp is not None:
+                self._remove(tmp)
+            return
+        self._evict()
+
+    def clear(self):
+        """ Removes all entries from the cache. """
+        for name in self._entries():
+            self._remove('/'.join([self.path, name]))
+
+    def _evict(self):
+        """ Removes the least recently used entries until the cache is no
+        larger than max_size. """
+        entries = []
+        size = 0
+        for name in self._entries():
+            try:
+                stat = os.stat('/'.join([self.path, name]))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            size += stat.st_size
+        entries.sort()
+        for _, esize, name in entries:
+            if size <= self.max_size:
+                break
+            self._remove('/'.join([self.path, name]))
+            size -= esize
+
+    def _entries(self):
+        """ Returns the names of all entries in the cache. """
+        return [x for x in os.listdir(self.path) if x.endswith('.ast')]
+
+    def _remove(self, entry):
+        """ Removes entry, ignoring missing files. """
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
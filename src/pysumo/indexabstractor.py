@@ -12,9 +12,12 @@ This module contains:
 """
 
 from io import StringIO
+from operator import itemgetter
+from weakref import WeakKeyDictionary
 
 import string
 
+from pysumo.parser import symbols, TokenType
 from pysumo.wordnet import WordNet
 
 class IndexAbstractor:
@@ -28,17 +31,29 @@ class IndexAbstractor:
     - root: The root AbstractSyntaxTree node.
     - ontologies: The list of currently active Ontologies.
     - index: The index of all terms in the currently active Ontologies.
+    - postings: The inverted index of all symbols in the currently active Ontologies.
+    - predicates: The index of the statements of every relation in the currently active Ontologies.
+    - arities: The index of the statements of every arity in the currently active Ontologies.
+    - generation: The number of changes to the index, increased by every update.
     - wordnet: A reference to the Object containing the SUMO-WordNet mapping.
 
     Methods:
 
     - init_wordnet: Initializes the WordNet mapping.
-    - update_index: Updates the index.
+    - update_index: Rebuilds the index.
+    - insert_statements: Adds statements to the index.
+    - remove_statements: Removes statements from the index.
+    - replace_ontology: Replaces the statements of an Ontology in the index.
     - search: Searches for a term in the Ontology.
     - get_ontology_file: Return an in-memory file object for an Ontology.
     - get_completions: Return a list of possible completions for the current index.
     - get_graph: Creates an abstract graph containing a view of the Ontology.
     - wordnet_locate: Returns information about a term from WordNet.
+    - wordnet_coverage: Returns which terms are mapped to WordNet.
+    - wordnet_hypernyms: Returns the terms related to a term as hypernyms in WordNet.
+    - wordnet_hyponyms: Returns the terms related to a term as hyponyms in WordNet.
+    - wordnet_distance: Returns the distance of two terms in WordNet's hypernym hierarchy.
+    - wordnet_subsumers: Returns the terms closest to two terms in WordNet's hypernym hierarchy.
 
     """
 
@@ -47,7 +62,15 @@ class IndexAbstractor:
         self.root = None
         self.ontologies = set()
         self.index = dict()
+        self.postings = dict()
+        self.predicates = dict()
+        self.arities = dict()
+        self.generation = 0
         self.wordnet = None
+        self._keys = dict()
+        self._segments = dict()
+        self._paths = dict()
+        self._texts = WeakKeyDictionary()
 
     def init_wordnet(self):
         """ Initializes the SUMO mapping to WordNet. """
@@ -55,38 +78,143 @@ class IndexAbstractor:
             self.wordnet = WordNet()
 
     def update_index(self, ast):
-        """ Updates the index with all new AST nodes in ast. """
+        """ Rebuilds the index from all statements of ast. """
         self.root = ast
         self.index = dict()
+        self.postings = dict()
+        self.predicates = dict()
+        self.arities = dict()
+        self._segments = dict()
         self._build_index()
+        self.generation += 1
+
+    def insert_statements(self, statements):
+        """ Adds statements, which were added to self.root, to the index. """
+        self._insert(statements)
+        self.generation += 1
+
+    def remove_statements(self, statements):
+        """ Removes statements, which were removed from self.root, from the index. """
+        self._remove(statements)
+        self.generation += 1
+
+    def replace_ontology(self, ontology, statements):
+        """ Replaces the statements of ontology in the index with statements,
+        the new segment of ontology in self.root. Only the old and the new
+        statements of ontology are looked at. """
+        self._remove(list(self._segments.pop(ontology, {}).values()))
+        self._insert(statements)
+        self.generation += 1
 
     def _build_index(self):
         """ Builds an index from self.root. """
-        for child in self.root.children:
+        self._insert(self.root.children)
+
+    def _insert(self, statements):
+        """ Adds statements to the index. self.index maps the normalized
+        first argument of every statement to the statements, self.postings
+        maps every normalized symbol to the pairs of the statements it occurs
+        in and its path in them as returned by occurrences, self.predicates
+        and self.arities map the symbol of the relation and the number of
+        arguments of every statement to the statements. The statements, and
+        the pairs keyed by the statement and the path, are kept in dicts
+        keyed by their id in the order they were added, so that they can be
+        removed without looking at the other statements. All are updated in
+        a single pass, which does not parse lazy statements. """
+        keys = self._keys
+        names = symbols.names
+        index = self.index
+        postings = self.postings
+        predicates = self.predicates
+        arities = self.arities
+        segments = self._segments
+        paths = self._paths
+        for child in statements:
+            ident = id(child)
             self.ontologies.add(child.ontology)
-            key = normalize(child.children[0].name)
-            asts = self.index.get(key, list())
-            asts.append(child)
-            self.index[key] = asts
+            try:
+                segments[child.ontology][ident] = child
+            except KeyError:
+                segments[child.ontology] = {ident: child}
+            term = child.heads(1)[0]
+            try:
+                key = keys[term]
+            except KeyError:
+                key = keys[term] = normalize(names[term])
+            try:
+                index[key][ident] = child
+            except KeyError:
+                index[key] = {ident: child}
+            try:
+                predicates[child.symbol][ident] = child
+            except KeyError:
+                predicates[child.symbol] = {ident: child}
+            for symbol, path in child.occurrences():
+                try:
+                    key = keys[symbol]
+                except KeyError:
+                    key = keys[symbol] = normalize(names[symbol])
+                # Only a few distinct paths exist, share them between postings
+                try:
+                    path = paths[path]
+                except KeyError:
+                    paths[path] = path
+                try:
+                    postings[key][(ident, path)] = (child, path)
+                except KeyError:
+                    postings[key] = {(ident, path): (child, path)}
+            # The arguments are visited in order, the last one has the highest position
+            arity = path[0]
+            try:
+                arities[arity][ident] = child
+            except KeyError:
+                arities[arity] = {ident: child}
+
+    def _remove(self, statements):
+        """ Removes statements from the index. The keys of every statement
+        are computed again and only its own entries are deleted, entries
+        which become empty are deleted as well. """
+        keys = self._keys
+        names = symbols.names
+        for child in statements:
+            ident = id(child)
+            term = child.heads(1)[0]
+            for index, key in ((self.index, keys.get(term) or normalize(names[term])),
+                               (self.predicates, child.symbol), (self._segments, child.ontology)):
+                _discard(index, key, ident)
+            occurrences = child.occurrences()
+            for symbol, path in occurrences:
+                _discard(self.postings, keys.get(symbol) or normalize(names[symbol]), (ident, path))
+            _discard(self.arities, occurrences[-1][1][0], ident)
 
     def get_ontology_file(self, ontology):
-        """ Returns an in-memory file object for the Kif representation of ontology. """
+        """ Returns an in-memory file object for the Kif representation of
+        ontology. The current state in the action log of ontology is only
+        decoded once after every change. """
         if ontology in self.ontologies:
+            current = ontology.action_log.current
+            try:
+                text = self._texts[current]
+            except KeyError:
+                text = self._texts[current] = current.getvalue().decode('utf8', errors='replace')
             ret = StringIO()
-            ontology.action_log.current.seek(0)
-            ret.write(ontology.action_log.current.read().decode('utf8'))
-            ontology.action_log.current.seek(0)
+            ret.write(text)
             ret.seek(0)
             return ret
 
     def get_completions(self):
         """ Returns a list of possible completions for the currently loaded ontologies. """
-        return [x[0].children[0].name for x in self.index.values()]
+        return [symbols.names[next(iter(x.values())).heads(1)[0]] for x in self.index.values()]
 
-    def search(self, term):
+    def search(self, term, position=1):
         """ Search for term in the in-memory Ontology. Returns all objects that
         match the search.
 
+        Arguments:
+
+        - term: the term to search for
+        - position: the argument position of term in the statements as in get_graph, 0 for the relation, n for the n-th argument or the relation of the form at n, None for any position at any depth
+
         Returns:
 
         - {Ontology : (String, int)[]}
@@ -94,15 +222,26 @@ class IndexAbstractor:
         """
         term = normalize(term)
         ret = {x: list() for x in self.ontologies}
-        for ast in self.index.get(term, []):
+        accepted = {(position,), (position, 0)}
+        seen = set()
+        for ast, path in self.postings.get(term, {}).values():
+            if position is not None and path not in accepted:
+                continue
+            if id(ast) in seen:
+                continue
+            seen.add(id(ast))
             ret[ast.ontology].append((repr(ast), ast.line))
+        # The statements of an Ontology are listed in the order of its file,
+        # whether they were indexed at once or by several updates
+        for results in ret.values():
+            results.sort(key=itemgetter(1))
         return ret
 
     def _find_term(self, term):
         """ Returns the denormalized version of term. """
         term = normalize(term)
         try:
-            return self.index[term][0].children[0].name
+            return symbols.names[next(iter(self.index[term].values())).heads(1)[0]]
         except KeyError:
             pass
         raise KeyError('%s not in index.' % term)
@@ -112,7 +251,7 @@ class IndexAbstractor:
 
         Arguments:
 
-        - variant: The list of terms against which the resulting AbstractGraph matches.
+        - variant: The list of terms against which the resulting AbstractGraph matches, by their name or, if there is no term of that name, by their normalized name.
         - major: The position of the parent element.
         - minor: The position of the child element.
         - root: The root node to which all other nodes are related.
@@ -130,12 +269,25 @@ class IndexAbstractor:
         if variant is None:
             return AbstractGraph(None, None, None, None, None, self.ontologies)
         else:
-            var = [(x, normalize(y)) for x, y in variant]
+            var = [(x, y if symbols.find(y) is not None else normalize(y)) for x, y in variant]
             try:
                 root = self._find_term(root)
             except AttributeError:
                 pass
-            return AbstractGraph(var, major, minor, root, depth, self.index)
+            return AbstractGraph(var, major, minor, root, depth, self._candidates(var, max(major, minor)))
+
+    def _candidates(self, variant, count):
+        """ Returns the statements which can match variant. These are the
+        statements of the relation if variant fixes the relation, the
+        statements with the term of variant at its position if it fixes an
+        argument, otherwise the statements with at least count arguments. """
+        for pos, name in variant:
+            if pos == 0:
+                return list(self.predicates.get(symbols.find(name), {}).values())
+        for pos, name in variant:
+            accepted = {(pos,), (pos, 0)}
+            return [x for x, path in self.postings.get(normalize(name), {}).values() if path in accepted]
+        return [x for arity, statements in self.arities.items() if arity >= count for x in statements.values()]
 
     def wordnet_locate(self, term):
         """ Use the mapping from SUMO to WordNet to retrieve information about a term.
@@ -163,16 +315,128 @@ class IndexAbstractor:
             results = self.wordnet.locate_term(term)
         return [' '.join([x[0], ''.join(['(', x[1].value, '):']), x[2]]) for x in results]
 
+    def wordnet_coverage(self):
+        """ Joins all terms in the index against the SUMO-WordNet mapping in
+        one pass. Terms are matched to the SUMO terms of the mapping by their
+        normalized names, the synsets are read from the index of the mapping
+        without parsing it.
+
+        Returns:
+
+        - ({String : (Pos, int)[]}, unmapped terms : set of String, mapped terms not in the index : set of String)
+
+        """
+        self.init_wordnet()
+        wordnet = self.wordnet
+        concepts = dict()
+        for concept in wordnet.mapping:
+            concepts.setdefault(normalize(concept), list()).append(concept)
+        names = symbols.names
+        kinds = symbols.kinds
+        mapped = dict()
+        unmapped = set()
+        for key, asts in self.index.items():
+            symbol = next(iter(asts.values())).heads(1)[0]
+            if kinds[symbol] is not TokenType.symbol:
+                continue
+            term = names[symbol]
+            try:
+                matches = concepts.pop(key)
+            except KeyError:
+                unmapped.add(term)
+                continue
+            mapped[term] = [x for concept in matches for x in wordnet.synsets(concept)]
+        return mapped, unmapped, {x for matches in concepts.values() for x in matches}
+
     def _synonym_locate(self, term):
-        try:
-            ret = list()
-            synset = self.wordnet.find_synonym(term)
-            for syn in synset:
-                ret.extend(self.wordnet.locate_term(syn))
-            return ret
-        except AttributeError:
+        """ Returns information about the SUMO terms which term is a word of
+        a synset of. """
+        if self.wordnet is None:
             self.init_wordnet()
-            return self._synonym_locate(term)
+        ret = list()
+        for syn in self.wordnet.find_synonym(term):
+            ret.extend(self.wordnet.locate_term(syn))
+        return ret
+
+    def _wordnet_term(self, term):
+        """ Returns the denormalized version of term or term itself if it is
+        not in the index. """
+        self.init_wordnet()
+        try:
+            return self._find_term(term)
+        except KeyError:
+            return term.strip()
+
+    def wordnet_hypernyms(self, term, transitive=True):
+        """ Returns the terms mapped to the hypernyms in WordNet of the synsets
+        term is mapped to.
+
+        Arguments:
+
+        - term: the term whose hypernyms are returned
+        - transitive: also return the hypernyms of the hypernyms
+
+        Returns:
+
+        - set of String
+
+        Raises:
+
+        - KeyError
+
+        """
+        term = self._wordnet_term(term)
+        return self.wordnet.hypernyms(term, transitive)
+
+    def wordnet_hyponyms(self, term, transitive=True):
+        """ Returns the terms mapped to the hyponyms in WordNet of the synsets
+        term is mapped to.
+
+        Arguments:
+
+        - term: the term whose hyponyms are returned
+        - transitive: also return the hyponyms of the hyponyms
+
+        Returns:
+
+        - set of String
+
+        Raises:
+
+        - KeyError
+
+        """
+        term = self._wordnet_term(term)
+        return self.wordnet.hyponyms(term, transitive)
+
+    def wordnet_distance(self, first, second):
+        """ Returns the length of the shortest path through a common hypernym
+        in WordNet between the synsets first and second are mapped to or None
+        if there is no such path.
+
+        Raises:
+
+        - KeyError
+
+        """
+        first, second = self._wordnet_term(first), self._wordnet_term(second)
+        return self.wordnet.distance(first, second)
+
+    def wordnet_subsumers(self, first, second):
+        """ Returns the terms mapped to the common hypernyms in WordNet which
+        are closest to the synsets first and second are mapped to.
+
+        Returns:
+
+        - set of String
+
+        Raises:
+
+        - KeyError
+
+        """
+        first, second = self._wordnet_term(first), self._wordnet_term(second)
+        return self.wordnet.lowest_common_subsumers(first, second)
 
 class AbstractGraph:
     """ An abstract representation of a subset of an Ontology as a collection
@@ -193,6 +457,7 @@ class AbstractGraph:
         if variant is None:
             self._ontology_graph(info)
         else:
+            self._symbols = [(x, symbols.find(y)) for x, y in variant]
             self._relation_graph(info)
             if root is not None:
                 self.nodes = sorted(self._filter_root(root, 0))
@@ -207,30 +472,32 @@ class AbstractGraph:
     def _check_matches(self, node):
         """ Checks if node matches the variant. """
         try:
-            for pos, val in self._settings[0]:
-                if pos == 0 and node.name != val:
+            for pos, val in self._symbols:
+                if pos == 0 and node.symbol != val:
                     return False
-                elif pos != 0 and node.children[pos - 1].name != val:
+                elif pos != 0 and node.heads(pos)[pos - 1] != val:
                     return False
             return True
         except IndexError:
             return False
 
-    def _relation_graph(self, index):
-        """ Produces an AbstractGraph containing all relations of type variant. """
+    def _relation_graph(self, statements):
+        """ Produces an AbstractGraph containing all relations of type variant
+        from the candidate statements. """
         major_pos = self._settings[1]
         minor_pos = self._settings[2]
+        count = max(major_pos, minor_pos)
         node_set = set()
-        for ast in index.values():
-            for node in ast:
-                if self._check_matches(node):
-                    minor = node.children[minor_pos - 1].name
-                    major = node.children[major_pos - 1].name
-                    node_set.add(AbstractGraphNode(minor))
-                    node_set.add(AbstractGraphNode(major))
-                    relation = self.relations.get(major, set())
-                    relation.add(minor)
-                    self.relations[major] = relation
+        for node in statements:
+            if self._check_matches(node):
+                heads = node.heads(count)
+                minor = symbols.names[heads[minor_pos - 1]]
+                major = symbols.names[heads[major_pos - 1]]
+                node_set.add(AbstractGraphNode(minor))
+                node_set.add(AbstractGraphNode(major))
+                relation = self.relations.get(major, set())
+                relation.add(minor)
+                self.relations[major] = relation
         self.nodes = sorted(node_set)
 
     def _filter_root(self, root, depth):
@@ -282,6 +549,14 @@ class AbstractGraphNode:
         return hash(self.name)
 
 
+def _discard(index, key, ident):
+    """ Deletes the entry ident of index[key] and index[key] if it becomes empty. """
+    entries = index.get(key)
+    if entries is not None:
+        entries.pop(ident, None)
+        if not entries:
+            del index[key]
+
 def normalize(term):
     """ Normalizes term to aid in searching. """
     for p in string.punctuation:
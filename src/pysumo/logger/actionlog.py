@@ -96,7 +96,9 @@ class ActionLog:
         if self.current is None:
             self.current = BytesIO()
         diff = self.log_io.diff(self.current, entry)
-        self.current = self.log_io.redo(self.current, diff)
+        # entry is what patching self.current with diff results in, so it
+        # becomes the current state without running patch
+        self.current = self.log_io.redo(self.current, diff, new=entry)
         self.actionlog.append(diff)
         self.redolog.clear()
         self.log_io.clear('redo')
@@ -290,9 +292,11 @@ class LogIO:
         signal.alarm(self.timeout)
         return self._patch(current, entry, reverse=True)
 
-    def redo(self, current, entry, clean=False):
+    def redo(self, current, entry, clean=False, new=None):
         """ Append entry to self.uwrite_queue.
-        If clean is True, pop an object from the redo queue. """
+        If clean is True, pop an object from the redo queue. If new is not
+        None, it is stored and returned as the result of applying entry to
+        current instead of patching current. """
         self.uwrite_queue.append(entry)
         if clean:
             self.pop('redo')
@@ -301,4 +305,8 @@ class LogIO:
             signal.alarm(self.timeout)
         else:
             self.flush_write_queues(None, None)
+        if new is not None:
+            with open(self.current, 'w+b') as cur:
+                cur.write(new.getbuffer())
+            return new
         return self._patch(current, entry)
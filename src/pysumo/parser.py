@@ -6,47 +6,291 @@ of SUMO terms to WordNet.
 This module contains:
 
 - AbstractSyntaxTree: The in-memory representation of an Ontology.
+- CompactAbstractSyntaxTree: A memory efficient AbstractSyntaxTree.
+- LazyAbstractSyntaxTree: A statement which is parsed on first access.
+- PartitionedAbstractSyntaxTree: The root of the in-memory Ontology, partitioned by Ontology.
+- SymbolTable: The table of interned names of AbstractSyntaxTree nodes.
+- TokenType: The kind of a token of a kif file.
+- SUMOConceptWordNetItem: The mapping of a WordNet synset to a SUMO term.
+- SynsetRecord: The fields of a WordNet synset shared by its SUMOConceptWordNetItems.
 - Ontology: Contains basic information about an Ontology.
 
 """
 
+import gc
+import pickle
 import re
-from io import StringIO
+from array import array
+from contextlib import contextmanager
+from io import BufferedIOBase, BytesIO, RawIOBase, StringIO
+from itertools import chain, repeat
+from mmap import mmap
+from multiprocessing import Pool
 
 from .logger import actionlog
 from enum import Enum
-from pickle import dumps
-
-def _tokenize_docstring(chars, f):
-    n = 0
-    ret = []
-
-    while  chars.count('"')%2 != 0 :
-        n += 1
-        line = f.readline()
-        line = line.strip()
-        chars = "".join([chars, line])
-    chars = chars.split('"')
-    while len(chars) > 1:
-        c = _tokenize(_cleanup(chars.pop(0)))
-        ret.extend(c)
-        ret.append("".join(['"',chars.pop(0),'"']))
-    ret.extend(_tokenize(_cleanup(chars.pop(0))))
-    return (ret, n)
 
+def _kiftokenize(infile, offset=0, binary=False, errors=None):
+    """ Tokenizes infile in a single pass and yields the tokens of every
+    top-level form together with its line number and the offsets of its
+    first and after its last character in infile as soon as it is complete.
+    The first line of infile is numbered offset.
+
+    Paren depth, string and comment state are tracked incrementally, so every
+    line of infile is only looked at once. The line number of a form is the
+    index of the line on which the logical line containing its opening paren
+    ends, i.e. a string literal which spans several lines is counted as part
+    of the line it started on. If binary is True, the lines of infile are
+    bytes and so are the tokens and offsets.
+
+    If errors is a list, syntax errors are appended to it instead of being
+    raised. Stray tokens outside of forms are skipped and a form or string
+    which is still open when a line starts with '(' after an empty or comment
+    line is dropped, the tokenizer resynchronizes at that line.
+
+    Raises:
+
+    - ParseError
+
+    """
+    lparen, rparen, quote_char, semicolon, _, empty = _BYTES_SYNTAX if binary else _TEXT_SYNTAX
+    tokenize = _tokenize_bytes if binary else _tokenize
+    form = []
+    pending = []
+    depth = 0
+    start = -1
+    column = 0
+    line = -1
+    string = None
+    string_line = -1
+    orphan = False
+    blank = True
+    base = 0
+    first = 0
+    for lineno, chars in enumerate(infile, offset):
+        pos = 0
+        if errors is not None:
+            if blank and (depth != 0 or string is not None) and chars[:1] == lparen:
+                for tokens, begin, end in pending:
+                    yield (tokens, string_line, begin, end)
+                if not orphan:
+                    errors.append(_unclosed(form, start, column, binary))
+                form = []
+                pending = []
+                depth = 0
+                line = -1
+                string = None
+                orphan = False
+            stripped = chars.strip()
+            blank = not stripped or (string is None and stripped[:1] == semicolon)
+        if string is not None:
+            end = chars.find(quote_char)
+            if end == -1:
+                string.append(chars.strip())
+                base += len(chars)
+                continue
+            string.append(chars[:end].lstrip())
+            string.append(quote_char)
+            if not orphan:
+                form.append(empty.join(string))
+            string = None
+            orphan = False
+            pos = end + 1
+        while True:
+            quote = chars.find(quote_char, pos)
+            code = chars[pos:] if quote == -1 else chars[pos:quote]
+            comment = code.find(semicolon)
+            if comment != -1:
+                code = code[:comment]
+                quote = -1
+            tokens = tokenize(code)
+            closing = code.count(rparen)
+            if closing < depth:
+                form.extend(tokens)
+                depth += code.count(lparen) - closing
+                tokens = ()
+            opened = closed = 0
+            for index, token in enumerate(tokens):
+                if token == lparen:
+                    opened += 1
+                    if depth == 0:
+                        start = lineno
+                        column = pos + _find_nth(code, lparen, opened)
+                        first = base + column
+                    depth += 1
+                elif token == rparen:
+                    closed += 1
+                    depth -= 1
+                    if depth == 0:
+                        form.append(token)
+                        last = base + pos + 1 + (code.rfind(rparen) if closed == closing
+                                                 else _find_nth(code, rparen, closed))
+                        if line == -1:
+                            pending.append((form, first, last))
+                        else:
+                            yield (form, line, first, last)
+                            line = -1
+                        form = []
+                        continue
+                    elif depth < 0:
+                        if errors is None:
+                            raise ParseError(chars.strip(), lineno + 1)
+                        errors.append(ParseError(chars.strip(), lineno + 1,
+                                                 pos + _find_nth(code, rparen, closed) + 1))
+                        depth = 0
+                        continue
+                elif depth == 0:
+                    if errors is None:
+                        raise ParseError(chars.strip(), lineno + 1)
+                    errors.append(ParseError(chars.strip(), lineno + 1, pos + _column(code, tokens, index) + 1))
+                    continue
+                form.append(token)
+            if quote == -1:
+                break
+            if depth == 0:
+                if errors is None:
+                    raise ParseError(chars.strip(), lineno + 1)
+                errors.append(ParseError(chars.strip(), lineno + 1, quote + 1))
+                orphan = True
+            end = chars.find(quote_char, quote + 1)
+            if end == -1:
+                string = [chars[quote:].rstrip()]
+                string_line = lineno
+                break
+            if orphan:
+                orphan = False
+            else:
+                form.append(chars[quote:end + 1])
+            pos = end + 1
+        if string is None:
+            for tokens, begin, end in pending:
+                yield (tokens, lineno, begin, end)
+            pending = []
+            if depth != 0 and line == -1:
+                line = lineno
+        base += len(chars)
+    if depth != 0 or string is not None:
+        if errors is None:
+            raise _unclosed(form, start, None, binary)
+        for tokens, begin, end in pending:
+            yield (tokens, string_line, begin, end)
+        if not orphan:
+            errors.append(_unclosed(form, start, column, binary))
+
+def _unclosed(form, start, column, binary):
+    """ Returns the ParseError of the form which starts at line start and is
+    never closed. """
+    if binary:
+        form = [x.decode('utf8', errors='replace') for x in form]
+    return ParseError(" ".join(form), start + 1, None if column is None else column + 1)
+
+def _column(code, tokens, index):
+    """ Returns the index of tokens[index] in code, the line fragment tokens
+    were split from. """
+    cursor = 0
+    for token in tokens[:index + 1]:
+        cursor = code.find(token, cursor) + len(token)
+    return cursor - len(tokens[index])
+
+def _find_nth(chars, sub, n):
+    """ Returns the index of the nth occurrence of sub in chars. """
+    index = chars.find(sub)
+    for _ in range(n - 1):
+        index = chars.find(sub, index + 1)
+    return index
 
 def _tokenize(chars):
     return chars.replace('(', ' ( ').replace(')', ' ) ').split()
 
-def _cleanup(chars):
-    if '"' in chars and ';' in chars and chars.find(";") > chars.find('"'):
-        return chars
-    chars = chars.split(";")
-    chars = chars[0]
-    chars = chars.strip()
-    return chars
+def _tokenize_bytes(chars):
+    return chars.replace(b'(', b' ( ').replace(b')', b' ) ').split()
+
+_TEXT_SYNTAX = ('(', ')', '"', ';', '\n', '')
+_BYTES_SYNTAX = (b'(', b')', b'"', b';', b'\n', b'')
+_BYTES_LINE = re.compile(b'[^\n]*\n|[^\n]+')
+
+def _form_boundaries(lines, start=0):
+    """ Yields the indices of all lines in lines from start on which start
+    outside of any form and string, i.e. the places where lines can be split
+    into chunks that are tokenized independently. Line start must itself be
+    such a place. Only parens, quotes and comments are looked at, syntax
+    errors are left to _kiftokenize. lines may be str or bytes. """
+    binary = start < len(lines) and isinstance(lines[start], bytes)
+    lparen, rparen, quote_char, semicolon, _, _ = _BYTES_SYNTAX if binary else _TEXT_SYNTAX
+    depth = 0
+    string = False
+    for lineno in range(start, len(lines)):
+        chars = lines[lineno]
+        if not string and depth <= 0:
+            yield lineno
+            depth = 0
+        if not string and quote_char not in chars and semicolon not in chars:
+            depth += chars.count(lparen) - chars.count(rparen)
+            continue
+        pos = 0
+        while True:
+            if string:
+                end = chars.find(quote_char, pos)
+                if end == -1:
+                    break
+                string = False
+                pos = end + 1
+            quote = chars.find(quote_char, pos)
+            code = chars[pos:] if quote == -1 else chars[pos:quote]
+            comment = code.find(semicolon)
+            if comment != -1:
+                code = code[:comment]
+                quote = -1
+            depth += code.count(lparen) - code.count(rparen)
+            if quote == -1:
+                break
+            string = True
+            pos = quote + 1
+
+def _parse_chunk(args):
+    """ Parses the lines of a chunk starting at line offset in a worker
+    process. Returns the AST serialized with astdumps or the ParseError. """
+    text, offset = args
+    root = AbstractSyntaxTree(None)
+    try:
+        for node in iterkifparse(StringIO(text) if isinstance(text, str) else text, None, offset=offset):
+            root.add_child(node)
+    except ParseError as err:
+        return err
+    return astdumps(root)
 
-def kifparse(infile, ontology, ast=None):
+def _parallel_kifparse(infile, ontology, compact, processes, offset):
+    """ Splits infile into processes chunks of complete top-level forms and
+    parses them in a pool of worker processes. """
+    infile, binary, source, base = _lines(infile)
+    lines = list(infile)
+    empty = _BYTES_SYNTAX[-1] if binary else _TEXT_SYNTAX[-1]
+    boundaries = _form_boundaries(lines)
+    size = len(lines) / processes
+    splits = [0]
+    for lineno in boundaries:
+        if lineno >= size * len(splits):
+            splits.append(lineno)
+    splits.append(len(lines))
+    chunks = [(empty.join(lines[a:b]), a + offset) for a, b in zip(splits, splits[1:]) if a < b]
+    if len(chunks) < 2:
+        # Nothing to split, e.g. an empty file, is parsed in this process
+        results = [_parse_chunk(x) for x in chunks]
+    else:
+        with Pool(min(processes, len(chunks))) as pool:
+            results = pool.map(_parse_chunk, chunks, chunksize=1)
+    node_type = CompactAbstractSyntaxTree if compact else AbstractSyntaxTree
+    root = node_type(ontology)
+    for (text, _), result in zip(chunks, results):
+        if isinstance(result, ParseError):
+            raise result
+        for child in astloads(result, ontology, compact, source, base).children:
+            root.add_child(child)
+        if source is not None:
+            base += len(text)
+    return root
+
+def kifparse(infile, ontology, ast=None, compact=False, processes=1, offset=0, lazy=False):
     """ Parse an ontology and return an AbstractSyntaxTree.
 
     Args:
@@ -54,68 +298,266 @@ def kifparse(infile, ontology, ast=None):
     - ontology: the ontology to parse
     - graph: a modified graph of this ontology
     - ast: the AST of ontologies which are needed from this ontology
-    - infile: the file object to parse
+    - infile: the text or binary file object, bytes-like object or mmap to parse
+    - compact: build the tree out of CompactAbstractSyntaxTree nodes
+    - processes: split infile at top-level forms and parse the chunks in this many worker processes
+    - offset: the line number of the first line of infile
+    - lazy: only parse statements when their children are accessed, see LazyAbstractSyntaxTree
 
     Returns:
 
     - AbstractSyntaxTree
 
+    Raises:
+
+    - ParseError
+
     """
-    root = AbstractSyntaxTree(ontology)
-    oldline = None
-    linenumber = -1
-    offset = 0
-    for i, line in enumerate(infile):
-        line = _cleanup(line)
-        if line == "":
-            continue
-        if '"' in line:
-            line, n = _tokenize_docstring(line, infile)
-            offset += n
+    if processes > 1 and not lazy:
+        return _parallel_kifparse(infile, ontology, compact, processes, offset)
+    root = (CompactAbstractSyntaxTree if compact else AbstractSyntaxTree)(ontology)
+    for node in iterkifparse(infile, ontology, compact=compact, offset=offset, lazy=lazy):
+        root.add_child(node)
+    return root
+
+def kifvalidate(infile, ontology, compact=False, offset=0, lazy=False):
+    """ Parses infile like kifparse, but does not stop at the first syntax
+    error. Stray tokens between forms are skipped and a form which is not
+    closed is dropped when the next top-level form starts, i.e. at a line
+    which starts with '(' after an empty or comment line. All errors are
+    collected in a single pass.
+
+    Args:
+
+    - infile: the file object, iterable of lines, bytes-like object or mmap to parse
+    - ontology: the ontology to parse
+    - compact: build the tree out of CompactAbstractSyntaxTree nodes
+    - offset: the line number of the first line of infile
+    - lazy: only parse statements when their children are accessed, see LazyAbstractSyntaxTree
+
+    Returns:
+
+    - (AbstractSyntaxTree, [ParseError]). The AST of all forms which were
+      parsed successfully and the errors with their line and column
+
+    """
+    errors = []
+    root = (CompactAbstractSyntaxTree if compact else AbstractSyntaxTree)(ontology)
+    for node in iterkifparse(infile, ontology, compact=compact, offset=offset, lazy=lazy, errors=errors):
+        root.add_child(node)
+    return root, errors
+
+def iterkifparse(infile, ontology, compact=False, offset=0, lazy=False, errors=None):
+    """ Parses infile and yields the AbstractSyntaxTree of every top-level
+    form as soon as it is complete, so that a kif file can be processed
+    while holding no more than one statement in memory. The line number of
+    each statement is stored in its line variable, the yielded nodes have no
+    parent.
+
+    Args:
+
+    - infile: the file object, iterable of lines, bytes-like object or mmap to parse
+    - ontology: the ontology to parse
+    - compact: build the statements out of CompactAbstractSyntaxTree nodes
+    - offset: the line number of the first line of infile
+    - lazy: yield LazyAbstractSyntaxTree nodes
+    - errors: a list to which syntax errors are appended instead of being raised, see kifvalidate
+
+    Binary input is tokenized without decoding it, only the name of every
+    distinct token is decoded once as UTF-8, see SymbolTable.intern_bytes.
+    If infile is held in memory, i.e. it is a StringIO, a BytesIO or bytes,
+    the span of every statement in it is stored in the statement's span
+    variable. An mmap, a bytearray or a memoryview is tokenized in place
+    without storing spans, as the caller may close or modify it.
+
+    Yields:
+
+    - AbstractSyntaxTree
+
+    Raises:
+
+    - ParseError
+
+    """
+    node_type = CompactAbstractSyntaxTree if compact else AbstractSyntaxTree
+    infile, binary, source, base = _lines(infile)
+    intern = (symbols._encoded if binary else symbols._ids).__getitem__
+    for tokens, line, start, end in _kiftokenize(infile, offset, binary, errors):
+        if lazy:
+            node = LazyAbstractSyntaxTree(ontology, line=line, child_type=node_type,
+                                          tokens=array('i', map(intern, tokens)))
         else:
-            line = _tokenize(line)
-        if oldline != None:
-            line = oldline + line
-            oldline = None
-        if line[0] != '(':
-            raise ParseError(" ".join(line),  i+1)
-        if line.count('(') != line.count(')'):
-            if linenumber == -1:
-                linenumber = i + offset
-            oldline = line
+            node = node_type(ontology, line=line)
+            node.parse(list(map(intern, tokens)))
+        if source is not None:
+            node.span = (source, base + start, base + end)
+        yield node
+
+def _lines(infile):
+    """ Returns an iterable of the lines of infile, whether they are bytes,
+    the content of infile if it is held in memory or None, and the offset in
+    it at which reading starts. """
+    if isinstance(infile, (mmap, bytearray, memoryview)):
+        # Read in place, the statements must not refer to a buffer that the
+        # caller may close or modify
+        start = infile.tell() if isinstance(infile, mmap) else 0
+        return (x.group() for x in _BYTES_LINE.finditer(infile, start)), True, None, 0
+    # The content of an in-memory file is kept so that kifserialize can
+    # write unchanged statements as slices of it
+    if isinstance(infile, bytes):
+        infile = BytesIO(infile)
+    if isinstance(infile, StringIO):
+        return infile, False, infile.getvalue(), infile.tell()
+    if isinstance(infile, BytesIO):
+        return infile, True, infile.getvalue(), infile.tell()
+    return infile, isinstance(infile, (BufferedIOBase, RawIOBase)), None, 0
+
+def kifreparse(ast, ontology, old, new, compact=False, lazy=False, changes=None):
+    """ Updates the statements of ontology in ast after its kif source was
+    edited from old to new. Only the lines between the common prefix and the
+    common suffix of old and new, widened to the enclosing top-level forms,
+    are parsed again. The resulting statements replace the old ones in ast
+    and the line numbers of all later statements are shifted.
+
+    Args:
+
+    - ast: the AST which contains the statements of ontology parsed from old
+    - ontology: the ontology which was edited
+    - old: the kif str or bytes from which the statements of ontology in ast were parsed
+    - new: the edited kif, of the same type as old
+    - compact: build the new statements out of CompactAbstractSyntaxTree nodes
+    - lazy: build the new statements out of LazyAbstractSyntaxTree nodes
+    - changes: a list to which the pair of the list of removed and the list of inserted statements is appended
+
+    Returns:
+
+    - bool. False if the edit spans the whole file, in which case ast is not
+      modified and new should be parsed with kifparse
+
+    Raises:
+
+    - ParseError
+
+    """
+    buffer_type = BytesIO if isinstance(old, bytes) else StringIO
+    olines = buffer_type(old).readlines()
+    nlines = buffer_type(new).readlines()
+    common = min(len(olines), len(nlines))
+    prefix = 0
+    while prefix < common and olines[prefix] == nlines[prefix]:
+        prefix += 1
+    if prefix == len(olines) == len(nlines):
+        if changes is not None:
+            changes.append(([], []))
+        return True
+    suffix = 0
+    while suffix < common - prefix and olines[-1 - suffix] == nlines[-1 - suffix]:
+        suffix += 1
+    # The lines before start are identical, so it is a boundary of both
+    start = 0
+    for lineno in _form_boundaries(olines):
+        if lineno > prefix:
+            break
+        start = lineno
+    # The first boundary of both in the common suffix ends the edit
+    delta = len(nlines) - len(olines)
+    oend = len(olines)
+    nboundaries = _form_boundaries(nlines, start)
+    nend = -1
+    for lineno in _form_boundaries(olines, start):
+        if lineno < len(olines) - suffix:
             continue
-        if linenumber == -1:
-            linenumber = i + offset
-        while line != [] and line.count('(') == line.count(')'):
-            node = AbstractSyntaxTree(ontology, line=linenumber)
-            parsed = node.parse(line)
-            line = line[parsed:]
-            root.add_child(node)
-        linenumber = -1
-    if oldline != None:
-        raise ParseError(" ".join(oldline), linenumber)
-    return root
+        while nend < lineno + delta:
+            nend = next(nboundaries, len(nlines))
+        if nend == lineno + delta:
+            oend = lineno
+            break
+    if start == 0 and oend == len(olines):
+        return False
+    region = buffer_type(new[:0].join(nlines[start:oend + delta]))
+    tree = kifparse(region, ontology, compact=compact, offset=start, lazy=lazy)
+    # The spans of all statements are moved to new, so that kifserialize
+    # keeps the comments around the edit
+    region = region.getvalue()
+    cstart = sum(map(len, nlines[:start]))
+    cdelta = len(new) - len(old)
+    texts = {id(old): True, id(region): True}
+    for child in tree.children:
+        if child.span is not None:
+            child.span = (new, cstart + child.span[1], cstart + child.span[2])
+    if isinstance(ast, PartitionedAbstractSyntaxTree):
+        # Only the segment of ontology is walked and spliced
+        children = ast.segments.setdefault(ontology, [])
+    else:
+        if not isinstance(ast.children, list):
+            ast.children = list(ast.children)
+        children = ast.children
+    removed = []
+    before = after = None
+    for n, child in enumerate(children):
+        if not child.ontology == ontology:
+            continue
+        span = child.span
+        if span is not None:
+            old_text = texts.get(id(span[0]))
+            if old_text is None:
+                old_text = texts[id(span[0])] = span[0] == old
+            if not old_text:
+                span = None
+        if child.line < start:
+            before = n
+            if span is not None:
+                child.span = (new, span[1], span[2])
+        elif child.line < oend:
+            removed.append(n)
+        else:
+            child.line += delta
+            if span is not None:
+                child.span = (new, span[1] + cdelta, span[2] + cdelta)
+            if after is None:
+                after = n
+    if removed:
+        pos = removed[0]
+    elif after is not None:
+        pos = after
+    elif before is not None:
+        pos = before + 1
+    else:
+        pos = len(children)
+    if changes is not None:
+        changes.append(([children[n] for n in removed], tree.children))
+    for n in reversed(removed):
+        children.pop(n)
+    for child in tree.children:
+        child.parent = ast
+    children[pos:pos] = tree.children
+    ast._invalidate()
+    return True
 
 def astmerge(trees):
-    """ Merge two Abstract Syntax Trees
+    """ Merge Abstract Syntax Trees
 
     Args:
 
-    - trees: a tuple of 2 AST objects
+    - trees: a tuple of AST objects
 
     Returns:
 
-    - AbstractSyntaxTree
+    - PartitionedAbstractSyntaxTree
 
     """
-    out = AbstractSyntaxTree(None)
-    out.children.extend(trees[0].children)
-    out.children.extend(trees[1].children)
+    out = PartitionedAbstractSyntaxTree(None)
+    for tree in trees:
+        for child in tree.children:
+            out.add_child(child)
     return out
 
 def kifserialize(ast, ontology, out):
     """ Writes ontology to disk as kif. Parses ast and writes out all nodes
-    that belong to ontology.
+    that belong to ontology. Consecutive statements which are unchanged since
+    they were parsed are written as a single slice of the text they were
+    parsed from, including the comments and formatting between them, all
+    other statements are rendered with repr.
 
     Args:
 
@@ -128,109 +570,498 @@ def kifserialize(ast, ontology, out):
     - OSError
 
     """
-    for child in ast.children:
-        if child.ontology != ontology:
+    text = None
+    written = False
+    for child in _statements(ast, ontology):
+        span = child.span
+        if span is not None and span[0] is text and span[1] >= end and _is_blank(text, end, span[1]):
+            end = span[2]
             continue
-        line = "".join([str(child), '\n'])
-        out.write(line)
+        if text is not None:
+            _write(out, text, begin, _comment_end(text, end))
+            out.write('\n')
+            text = None
+        if span is None:
+            out.write(repr(child))
+            out.write('\n')
+        else:
+            text, begin, end = span
+            if not written and _is_blank(text, 0, begin):
+                begin = 0
+        written = True
+    if text is not None:
+        if _is_blank(text, end, len(text)):
+            end = len(text)
+        _write(out, text, begin, end)
+        if text[end - 1:end] not in ('\n', b'\n'):
+            out.write('\n')
+
+def _write(out, text, begin, end):
+    """ Writes text[begin:end] to out, decoding it if text is binary. """
+    chars = text[begin:end]
+    out.write(chars if isinstance(chars, str) else chars.decode('utf8', errors='replace'))
+
+def _comment_end(text, end):
+    """ Returns the end of the line at end in text if the rest of the line is
+    a comment, so that comments behind a statement are kept with it. """
+    newline = text.find('\n' if isinstance(text, str) else b'\n', end)
+    if newline == -1:
+        newline = len(text)
+    return newline if _is_blank(text, end, newline) else end
+
+def _is_blank(text, start, end):
+    """ Returns True if text[start:end] only consists of whitespace and
+    comments. """
+    _, _, _, semicolon, linefeed, _ = _TEXT_SYNTAX if isinstance(text, str) else _BYTES_SYNTAX
+    while start < end:
+        newline = text.find(linefeed, start, end)
+        if newline == -1:
+            newline = end
+        stop = text.find(semicolon, start, newline)
+        if stop == -1:
+            stop = newline
+        if start < stop and not text[start:stop].isspace():
+            return False
+        start = newline + 1
+    return True
+
+VERSION = 3
+""" The version of the AST produced by kifparse. It must be incremented
+whenever kifparse or the format written by astdumps changes, as it is part of
+the key of cached ASTs. """
+
+def astdumps(ast):
+    """ Serializes an Abstract Syntax Tree into a compact binary string.
+
+    Names are written once to a string table and the nodes of every
+    statement in pre-order as pairs of name index and number of children, so
+    that astloads can rebuild the tree without tokenizing or unpickling a
+    Python object per node. The character offsets of the statements' spans
+    are kept if they all refer to the same text, the text itself and the
+    Ontology are not serialized.
+
+    Args:
+
+    - ast: the AST of a single Ontology as returned by kifparse
+
+    Returns:
+
+    - bytes
+
+    """
+    names = []
+    ids = dict()
+    nodes = array('i')
+    lines = array('i')
+    spans = array('i')
+    text = None
+    for child in ast.children:
+        lines.append(child.line)
+        if spans is not None:
+            span = child.span
+            if span is None or (text is not None and span[0] is not text):
+                spans = None
+            else:
+                text = span[0]
+                spans.append(span[1])
+                spans.append(span[2])
+        stack = [child]
+        while stack:
+            node = stack.pop()
+            try:
+                index = ids[node.symbol]
+            except KeyError:
+                index = ids[node.symbol] = len(names)
+                names.append(node.name)
+            nodes.append(index)
+            nodes.append(len(node.children))
+            stack.extend(reversed(node.children))
+    spans = spans.tobytes() if spans is not None else b''
+    return pickle.dumps((VERSION, names, nodes.tobytes(), lines.tobytes(), spans),
+                        pickle.HIGHEST_PROTOCOL)
+
+@contextmanager
+def _gc_disabled():
+    """ Disables the garbage collector in the block and restores its
+    previous state on leaving it, so that allocating many objects which are
+    all kept does not trigger useless collections. """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def astloads(data, ontology, compact=False, source=None, base=0):
+    """ Rebuilds an Abstract Syntax Tree serialized with astdumps.
+
+    Args:
+
+    - data: the binary string returned by astdumps
+    - ontology: the Ontology to which the AST belongs
+    - compact: build the tree out of CompactAbstractSyntaxTree nodes
+    - source: the text from which the AST was parsed, restores the spans of the statements
+    - base: the offset in source of the text that was parsed
+
+    Returns:
+
+    - AbstractSyntaxTree
+
+    Raises:
+
+    - ValueError
+
+    """
+    version, names, nodes, lines, spans = pickle.loads(data)
+    if version != VERSION:
+        raise ValueError('AST version %d is not %d' % (version, VERSION))
+    node_type = CompactAbstractSyntaxTree if compact else AbstractSyntaxTree
+    symbol = [symbols.intern(x) for x in names]
+    nodes = iter(array('i', nodes))
+    root = node_type(ontology)
+    root.children = []
+    with _gc_disabled():
+        for line in array('i', lines):
+            stack = []
+            for index in nodes:
+                node = node_type(ontology, line=line)
+                node.symbol = symbol[index]
+                count = next(nodes)
+                if stack:
+                    parent, left = stack[-1]
+                    node.parent = parent
+                    parent.children.append(node)
+                    if left == 1:
+                        stack.pop()
+                    else:
+                        stack[-1] = (parent, left - 1)
+                else:
+                    node.parent = root
+                    root.children.append(node)
+                if count:
+                    node.children = []
+                    stack.append((node, count))
+                elif not stack:
+                    break
+    if source is not None and spans:
+        spans = array('i', spans)
+        for n, child in enumerate(root.children):
+            child.span = (source, base + spans[2 * n], base + spans[2 * n + 1])
+    return root
 
 WORDNET_REGEX = re.compile(r'^(\d{8}) (\d{2}) ([nvasr]) ([0-9a-zA-Z]{2})(?: (\S+ ([0-9a-zA-Z])))+ (\d{3})(?: ((\S{1,2}) \d{8} [nvasr] [0-9a-zA-Z]{4}))*(?: \d{2} (\+ \d{2} [0-9a-zA-Z]{2} )+)? ?\| .+ &%.+[\][@+:=]$')
 
-def wparse(datafiles):
+WORDNET_VERSION = 3
+
+def wparse(datafiles, strict=False):
     """ Parses the file containing the SUMO-WordNet mapping.
 
+    Lines are split into their fields directly, lines which do not map a
+    synset to a SUMO term or which are malformed are skipped. If strict is
+    True, every line is validated with WORDNET_REGEX first and the number
+    of lines read is checked against the SUMO-WordNet mapping files
+    distributed with pySUMO.
+
     Args:
 
-    - path: The path to the SUMO-WordNet mapping files
+    - datafiles: pairs of the SUMO-WordNet mapping files opened in binary mode and their Pos
+    - strict: validate the mapping files
 
     Returns:
 
     - Dictionary
 
+    Raises:
+
+    - AssertionError
+
     """
     mapping = dict()
+    with _gc_disabled():
+        for _, _, items in _wlines(datafiles, strict, dict()):
+            for item in items:
+                try:
+                    mapping[item.sumo_concept].add(item)
+                except KeyError:
+                    mapping[item.sumo_concept] = {item}
+    return mapping
+
+def windex(datafiles, strict=False):
+    """ Indexes the file containing the SUMO-WordNet mapping without keeping
+    the parsed items. Every line is addressed by a key, the byte offset of
+    the line times 4 plus the index of its Pos in Pos, from which wread
+    parses it again. The lines are parsed like in wparse.
+
+    Args:
+
+    - datafiles: pairs of the SUMO-WordNet mapping files opened in binary mode, as mmap or bytes and their Pos
+    - strict: validate the mapping files
+
+    Returns:
+
+    - (Dictionary of SUMO terms to an array of keys, Dictionary as returned by wsynonyms)
+
+    Raises:
+
+    - AssertionError
+
+    """
+    index = dict()
+    synonyms = dict()
+    for pos, offset, items in _wlines(datafiles, strict):
+        key = 4 * offset + _POS_NUMBERS[pos]
+        for item in items:
+            concept = item.sumo_concept
+            try:
+                keys = index[concept]
+            except KeyError:
+                index[concept] = array('q', [key])
+            else:
+                if keys[-1] != key:
+                    keys.append(key)
+            for word in item.synset:
+                try:
+                    synonyms[word[0]].add(concept)
+                except KeyError:
+                    synonyms[word[0]] = {concept}
+    return index, {word: tuple(concepts) for word, concepts in synonyms.items()}
+
+def wread(datafiles, key):
+    """ Parses the line of the SUMO-WordNet mapping addressed by key.
+
+    Args:
+
+    - datafiles: the contents of the SUMO-WordNet mapping files as bytes or mmap in the order of Pos
+    - key: a key from the index returned by windex
+
+    Returns:
+
+    - set of SUMOConceptWordNetItem
+
+    """
+    number = key & 3
+    data = datafiles[number]
+    offset = key >> 2
+    end = data.find(b'\n', offset)
+    if end == -1:
+        end = len(data)
+    return _wtokenize(data[offset:end].decode('utf8'), _POS_ORDER[number])
+
+def wsynset(datafiles, key):
+    """ Returns the synset of the line of the SUMO-WordNet mapping addressed
+    by key without parsing the line.
+
+    Args:
+
+    - datafiles: the contents of the SUMO-WordNet mapping files as bytes or mmap in the order of Pos
+    - key: a key from the index returned by windex
+
+    Returns:
+
+    - (Pos, int)
+
+    Raises:
+
+    - ValueError
+
+    """
+    number = key & 3
+    offset = key >> 2
+    return _POS_ORDER[number], int(datafiles[number][offset:offset + 8])
+
+def wsynsets(datafiles, symbols):
+    """ Yields every synset of the SUMO-WordNet mapping files, whether it is
+    mapped to a SUMO term or not, with its pointers of the given types. Only
+    the synset offset and the pointers are parsed, malformed lines are
+    skipped.
+
+    Args:
+
+    - datafiles: pairs of the SUMO-WordNet mapping files opened in binary mode, as mmap or bytes and their Pos
+    - symbols: the pointer symbols of the pointers to parse
+
+    Yields:
+
+    - (Pos, key as in windex, synset offset, [(pointer symbol, Pos, synset offset)])
+
+    """
+    symbols = sorted(symbols, key=len, reverse=True)
+    pointer = re.compile(b' (%s) (\\d{8}) ([nvasr]) [0-9a-fA-F]{4}(?= )' % b'|'.join(re.escape(x.encode()) for x in symbols))
+    for data, pos in datafiles:
+        if not isinstance(data, bytes):
+            data.seek(0)
+            data = data.read()
+        number = _POS_NUMBERS[pos]
+        offset = 0
+        for line in data.split(b'\n'):
+            start = offset
+            offset += len(line) + 1
+            if not line[:8].isdigit():
+                continue
+            # The space before '|' ends the last pointer
+            end = line.find(b' | ')
+            fields = line if end == -1 else line[:end + 1]
+            yield pos, 4 * start + number, int(line[:8]), [(symbol.decode(), _POSES[ptr_pos.decode()], int(ptr_offset))
+                                                            for symbol, ptr_offset, ptr_pos in pointer.findall(fields)]
+
+def _wlines(datafiles, strict, shared=None):
+    """ Yields the Pos, the byte offset and the items of every line of the
+    SUMO-WordNet mapping files which maps a synset to a SUMO term. The items
+    share equal values through the Dictionary shared as in _wtokenize. """
     total, processed = 0, 0
     for data, pos in datafiles:
-        data.seek(0)
-        sdata = StringIO(data.read().decode('utf8'))
-        for line in sdata:
-            total += 1
-            #Syntactical validation
-            if WORDNET_REGEX.match(line):
-                items = _wtokenize(line.rstrip('\n'), pos)
-                processed += 1
-                for item in items:
-                    try:
-                        mapping[item.sumo_concept].add(item)
-                    except KeyError:
-                        mapping[item.sumo_concept] = {item}
-    #TODO: Remove the fixed assertions/replace with dynamic assertions
-    assert total == 117939, '%d lines were read, but %d lines should have been read' % (total, 117939)
-    assert processed >= 117659 - 2000, 'processed %d, should have processed %d' % (processed, 117659)
-    return mapping
+        if not isinstance(data, bytes):
+            data.seek(0)
+            data = data.read()
+        lines = data.split(b'\n')
+        if lines[-1] == b'':
+            lines.pop()
+        total += len(lines)
+        offset = 0
+        for line in lines:
+            start = offset
+            offset += len(line) + 1
+            if strict:
+                line = line.decode('utf8')
+                if not WORDNET_REGEX.match(line):
+                    continue
+                items = _wtokenize(line, pos, shared)
+            elif b'&%' not in line or line[:1] == b';':
+                continue
+            else:
+                try:
+                    items = _wtokenize(line.decode('utf8'), pos, shared)
+                except (ValueError, IndexError, KeyError):
+                    continue
+            processed += 1
+            yield pos, start, items
+    if strict:
+        #TODO: Remove the fixed assertions/replace with dynamic assertions
+        assert total == 117939, '%d lines were read, but %d lines should have been read' % (total, 117939)
+        assert processed >= 117659 - 2000, 'processed %d, should have processed %d' % (processed, 117659)
+
+def _wtokenize(line, pos, shared=None):
+    """ Returns all the tokens of a WordNet data line. Equal words, pointers,
+    frames and SUMO terms are taken from the Dictionary shared if given, so
+    that lines tokenized with the same Dictionary share them.
+
+    Raises:
+
+    - ValueError
+    - IndexError
+    - KeyError
 
-def _wtokenize(line, pos):
-    """ Returns all the tokens of a WordNet data line. """
+    """
+    share = (shared if shared is not None else dict()).setdefault
     items = line.split(' ')
-    # byte offset in current file
-    synset_offset = int(items.pop(0))
-    lex_filenum = int(items.pop(0))
-    ss_type = SSType(items.pop(0))
-    w_cnt = int(items.pop(0), 16)
-    synset = list()
-    for i in range(0, w_cnt):
-        word = items.pop(0)
-        if pos == Pos.adj and word[-1] == ')':
-            listy = word.split('(')
-            syn_marker = listy.pop()[:-1]
-            word = listy.pop()
-        else:
-            syn_marker = None
-        lex_id = int(items.pop(0), 16)
-        synset.append((word, syn_marker, lex_id))
-    assert len(synset) == w_cnt, 'line %s has %d synsets, but should have %d' % (line, w_cnt, len(synset))
-    p_cnt = int(items.pop(0))
-    ptr_list = list()
-    for i in range(0, p_cnt):
-        pointer_symbol = items.pop(0)
-        synset_offset = int(items.pop(0))
-        p_pos = Pos(items.pop(0))
-        so_ta = items.pop(0)
-        source = int(so_ta[:2], 16)
-        target = int(so_ta[2:], 16)
-        ptr_list.append((pointer_symbol, p_pos, synset_offset, source, target))
-    assert len(ptr_list) == p_cnt, 'line "%s" has %d pointers, but %s only contains %d' % (line, p_cnt, ptr_list, len(ptr_list))
+    lex_filenum = int(items[1])
+    ss_type = _SSTYPES[items[2]]
+    index = 4 + 2 * int(items[3], 16)
+    words = items[4:index:2]
+    if pos is Pos.adj:
+        markers = [None] * len(words)
+        for i, word in enumerate(words):
+            if word[-1] == ')':
+                words[i], marker = word.rsplit('(', 1)
+                markers[i] = marker[:-1]
+    else:
+        markers = repeat(None)
+    synset = [share(x, x) for x in zip(words, markers, map(_HEX.__getitem__, items[5:index:2]))]
+    end = index + 1 + 4 * int(items[index])
+    offsets = list(map(int, items[index + 2:end:4]))
+    ptr_list = [share(x, x) for x in
+                [(symbol, ptr_pos, offset) + so_ta for symbol, ptr_pos, offset, so_ta in
+                 zip(items[index + 1:end:4], map(_POSES.__getitem__, items[index + 3:end:4]),
+                     offsets, map(_SOURCE_TARGET.__getitem__, items[index + 4:end:4]))]]
+    synset_offset = int(items[0])
     frames = None
-    if ss_type == SSType.verb:
-        f_cnt = int(items.pop(0))
-        frames = set()
-        for i in range(0, f_cnt):
-            assert items.pop(0) == '+', "Frames not separated by a '+'"
-            f_num = int(items.pop(0))
-            w_num = int(items.pop(0), 16)
-            frames.add((f_num, w_num))
-        assert len(frames) == f_cnt, 'line %s has %d frames, but should have %d' % (line, f_cnt, len(frames))
-    assert items.pop(0) == '|', "Missing '|' separator"
-    assert len(items) != 0, 'No gloss or SUMO-term in %s' % line
-    string = ' '.join(items)
-    assert string != ''
-    items = string.split('&%')
-    assert len(items) >= 2, '"%s": %s should contain at least 2 items, but contains %d' % (line, items, len(items))
-    gloss = items.pop(0).rstrip()
-    sumo_concepts = set()
-    while len(items) > 0:
-        name = items.pop(0)
-        suffix = name[-1:]
-        name = name[:-1]
-        sumo_concepts.add(SUMOConceptWordNetItem(name, suffix, synset_offset, lex_filenum, ss_type, synset, ptr_list, frames, gloss))
-    return sumo_concepts
+    if ss_type is SSType.verb:
+        index = end + 1 + 3 * int(items[end])
+        frames = list()
+        for i in range(end + 1, index, 3):
+            if items[i] != '+':
+                raise ValueError("Frames not separated by a '+' in %s" % line)
+            frames.append((int(items[i + 1]), int(items[i + 2], 16)))
+        frames = frozenset(frames)
+        frames = share(frames, frames)
+        end = index
+    if items[end] != '|':
+        raise ValueError("Missing '|' separator in %s" % line)
+    concepts = ' '.join(items[end + 1:]).split('&%')
+    if len(concepts) < 2:
+        raise ValueError('No gloss or SUMO-term in %s' % line)
+    record = SynsetRecord(synset_offset, lex_filenum, ss_type, synset, ptr_list, frames, concepts[0].rstrip())
+    return {SUMOConceptWordNetItem(share(name[:-1], name[:-1]), name[-1:], record) for name in concepts[1:]}
 
-class SUMOConceptWordNetItem:
-    """ The object returned from _wtokenize containing info on the SUMO-WordNet mapping. """
-    def __init__(self, sumo_concept, suffix, synset_offset, lex_filenum,
-                 ss_type, synset, ptr_list, frames, gloss):
-        self.sumo_concept = sumo_concept
-        self.suffix = suffix
+def wsynonyms(mapping):
+    """ Builds the reverse index of the SUMO-WordNet mapping.
+
+    Args:
+
+    - mapping: the Dictionary returned by wparse
+
+    Returns:
+
+    - Dictionary of the words of the synsets to the tuple of SUMO terms they are mapped to
+
+    """
+    synonyms = dict()
+    for concept, items in mapping.items():
+        for item in items:
+            for word in item.synset:
+                try:
+                    synonyms[word[0]].add(concept)
+                except KeyError:
+                    synonyms[word[0]] = {concept}
+    return {word: tuple(concepts) for word, concepts in synonyms.items()}
+
+def wdumps(index, synonyms):
+    """ Serializes the index of the SUMO-WordNet mapping returned by windex
+    and its reverse index into a binary string.
+
+    Args:
+
+    - index: the Dictionary of SUMO terms to keys returned by windex
+    - synonyms: the reverse index returned by windex
+
+    Returns:
+
+    - bytes
+
+    """
+    return pickle.dumps((WORDNET_VERSION, index, synonyms), pickle.HIGHEST_PROTOCOL)
+
+def wloads(data):
+    """ Rebuilds the index of the SUMO-WordNet mapping and its reverse index
+    serialized with wdumps.
+
+    Args:
+
+    - data: the binary string returned by wdumps
+
+    Returns:
+
+    - (Dictionary, Dictionary)
+
+    Raises:
+
+    - ValueError
+
+    """
+    with _gc_disabled():
+        version, index, synonyms = pickle.loads(data)
+    if version != WORDNET_VERSION:
+        raise ValueError('WordNet version %d is not %d' % (version, WORDNET_VERSION))
+    return index, synonyms
+
+class SynsetRecord:
+    """ The fields of a WordNet data line, shared by the SUMOConceptWordNetItems
+    of all SUMO terms the synset is mapped to. """
+
+    __slots__ = ('synset_offset', 'lex_filenum', 'ss_type', 'synset', 'ptr_list', 'frames', 'gloss')
+
+    def __init__(self, synset_offset, lex_filenum, ss_type, synset, ptr_list, frames, gloss):
         self.synset_offset = synset_offset
         self.lex_filenum = lex_filenum
         self.ss_type = ss_type
@@ -239,12 +1070,45 @@ class SUMOConceptWordNetItem:
         self.frames = frames
         self.gloss = gloss
 
+    def __reduce__(self):
+        return (SynsetRecord, tuple(getattr(self, x) for x in self.__slots__))
+
+def _record_field(name):
+    """ Returns a property reading the field name of the SynsetRecord of a SUMOConceptWordNetItem. """
+    return property(lambda self: getattr(self.record, name))
+
+class SUMOConceptWordNetItem:
+    """ The object returned from _wtokenize containing info on the SUMO-WordNet
+    mapping. The fields of the synset are read from its SynsetRecord. """
+
+    __slots__ = ('sumo_concept', 'suffix', 'record')
+
+    def __init__(self, sumo_concept, suffix, record):
+        self.sumo_concept = sumo_concept
+        self.suffix = suffix
+        self.record = record
+
+    synset_offset = _record_field('synset_offset')
+    lex_filenum = _record_field('lex_filenum')
+    ss_type = _record_field('ss_type')
+    synset = _record_field('synset')
+    ptr_list = _record_field('ptr_list')
+    frames = _record_field('frames')
+    gloss = _record_field('gloss')
+
+    def __reduce__(self):
+        return (SUMOConceptWordNetItem, (self.sumo_concept, self.suffix, self.record))
+
 class Pos(Enum):
     noun = 'n'
     verb = 'v'
     adj = 'a'
     adv = 'r'
 
+    # Members are singletons, hashing them by identity is much cheaper than
+    # Enum's hash when pointers are deduplicated in _wtokenize
+    __hash__ = object.__hash__
+
 class SSType(Enum):
     noun = 'n'
     verb = 'v'
@@ -252,7 +1116,327 @@ class SSType(Enum):
     adv = 'r'
     adj_sat = 's'
 
-class AbstractSyntaxTree:
+_POSES = {x.value: x for x in Pos}
+_POS_ORDER = list(Pos)
+_POS_NUMBERS = {x: n for n, x in enumerate(_POS_ORDER)}
+_SSTYPES = {x.value: x for x in SSType}
+
+class _Hex(dict):
+    """ Caches the values of hexadecimal numbers. """
+    def __missing__(self, key):
+        value = self[key] = int(key, 16)
+        return value
+
+class _SourceTarget(dict):
+    """ Caches the source and target word numbers of a WordNet pointer. """
+    def __missing__(self, key):
+        if len(key) != 4:
+            raise ValueError('Invalid source/target %s' % key)
+        value = self[key] = (int(key[:2], 16), int(key[2:], 16))
+        return value
+
+_HEX = _Hex()
+_SOURCE_TARGET = _SourceTarget()
+
+class TokenType(Enum):
+    paren = '('
+    symbol = 's'
+    variable = '?'
+    row_variable = '@'
+    number = '0'
+    string = '"'
+
+NUMBER_REGEX = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+
+def classify(token):
+    """ Returns the TokenType of token or None if token is empty. """
+    first = token[:1]
+    if first == '"':
+        return TokenType.string
+    elif first == '?':
+        return TokenType.variable
+    elif first == '@':
+        return TokenType.row_variable
+    elif token == '(' or token == ')':
+        return TokenType.paren
+    elif first in '0123456789+-.' and NUMBER_REGEX.match(token):
+        return TokenType.number
+    elif not first:
+        return None
+    return TokenType.symbol
+
+class SymbolTable:
+    """ The table of all names in the AbstractSyntaxTree. Every name is interned
+    and assigned a stable integer id, so that all nodes with the same name share
+    a single string object and can be compared and hashed by id. Every name is
+    classified once when it is interned. There is one SymbolTable per
+    process, symbols, and ids are never reused.
+
+    Variables:
+
+    - names: The list of all interned names, indexed by id.
+    - kinds: The list of the TokenType of all interned names, indexed by id.
+
+    Methods:
+
+    - intern: Returns the id of a name, adding it to the table if necessary.
+    - intern_bytes: Returns the id of a UTF-8 encoded name.
+    - find: Returns the id of a name or None if it is not in the table.
+
+    """
+
+    def __init__(self):
+        self.names = ['']
+        self.kinds = [None]
+        # Looking up a name that is already interned, by far the most common
+        # case, never leaves C code
+        self._ids = _Ids(self)
+        self._ids[''] = 0
+        self._encoded = _EncodedIds(self._ids)
+        self._encoded[b''] = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name):
+        """ Returns the id of name, adding name to the table if necessary. """
+        return self._ids[name]
+
+    def intern_bytes(self, name):
+        """ Returns the id of the UTF-8 encoded name. name is only decoded
+        the first time it is seen. """
+        return self._encoded[name]
+
+    def find(self, name):
+        """ Returns the id of name or None if name is not in the table. """
+        return self._ids.get(name)
+
+class _Ids(dict):
+    """ The ids of the names of a SymbolTable, missing names are added. """
+
+    def __init__(self, table):
+        super(_Ids, self).__init__()
+        self.table = table
+
+    def __missing__(self, name):
+        table = self.table
+        sid = self[name] = len(table.names)
+        table.names.append(name)
+        table.kinds.append(classify(name))
+        return sid
+
+class _EncodedIds(dict):
+    """ The ids of UTF-8 encoded names, missing names are decoded once. """
+
+    def __init__(self, ids):
+        super(_EncodedIds, self).__init__()
+        self.ids = ids
+
+    def __missing__(self, name):
+        sid = self[name] = self.ids[name.decode('utf8', errors='replace')]
+        return sid
+
+symbols = SymbolTable()
+_OPEN = symbols.intern('(')
+_CLOSE = symbols.intern(')')
+
+class _AbstractSyntaxTreeBase:
+    """ The methods shared by AbstractSyntaxTree and CompactAbstractSyntaxTree. """
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        """ The name of the node, the interned string of self.symbol. """
+        return symbols.names[self.symbol]
+
+    @name.setter
+    def name(self, name):
+        self.symbol = symbols.intern(name)
+        self._invalidate()
+
+    @property
+    def element_type(self):
+        """ The TokenType of the name of the node. """
+        return symbols.kinds[self.symbol]
+
+    def __repr__(self):
+        names = symbols.names
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                parts.append(')')
+            elif node.children:
+                parts.append('(')
+                parts.append(names[node.symbol])
+                stack.append(None)
+                stack.extend(reversed(node.children))
+            else:
+                parts.append(names[node.symbol])
+        return ' '.join(parts)
+
+    def __eq__(self, other):
+        """ Two nodes are equal if they belong to the same Ontology and have the
+        same name and structurally equal children. """
+        if not isinstance(other, _AbstractSyntaxTreeBase):
+            return False
+        pairs = [(self, other)]
+        while pairs:
+            a, b = pairs.pop()
+            if a is b:
+                continue
+            if (a.symbol != b.symbol or len(a.children) != len(b.children)
+                    or not _same_ontology(a.ontology, b.ontology)):
+                return False
+            if a._hash is not None and b._hash is not None and a._hash != b._hash:
+                return False
+            pairs.extend(zip(a.children, b.children))
+        return True
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        """ Returns the content hash of the subtree rooted at self. The hash of
+        every node is computed bottom-up from its name and the
+        hashes of its children and is cached until the node or one of its
+        descendants is changed with add_child or remove_child. """
+        if self._hash is None:
+            nodes = [(self, False)]
+            while nodes:
+                node, expanded = nodes.pop()
+                if node._hash is not None:
+                    continue
+                if expanded or not node.children:
+                    node._hash = hash((node.symbol, tuple([x._hash for x in node.children])))
+                else:
+                    nodes.append((node, True))
+                    nodes.extend([(x, False) for x in node.children if x._hash is None])
+        return self._hash
+
+    def _unpickled(self):
+        """ Restores the variables which are not pickled. """
+        # Neither the parent, the cached hash nor the span are pickled: a
+        # pickled subtree does not drag its ancestors or its source along and
+        # hashes of strings differ between processes.
+        self.parent = None
+        self._hash = None
+        self.span = None
+        for child in self.children:
+            child.parent = self
+
+    def _invalidate(self):
+        """ Clears the cached hash and the span of self and all its ancestors. """
+        node = self
+        while node is not None:
+            node._hash = None
+            node.span = None
+            node = node.parent
+
+    def parse(self, tokens, start=0):
+        """ Builds the subtree of the form which starts at tokens[start].
+        tokens is a sequence of the symbols of the tokens of the form.
+
+        The tree is built in a single pass over tokens using an explicit stack
+        of the currently open lists, so neither the nesting depth nor the
+        length of the form is limited by the recursion limit and tokens is
+        never copied.
+
+        Returns:
+
+        - int. The index of the first token after the form.
+
+        """
+        stack = []
+        node = None
+        name = False
+        opening = _OPEN
+        closing = _CLOSE
+        node_type = self._child_type()
+        # The new nodes are appended directly, none of them has a hash or a
+        # span that add_child would have to clear
+        for i in range(start, len(tokens)):
+            token = tokens[i]
+            if name:
+                node.symbol = token
+                name = False
+            elif token == opening:
+                if node is None:
+                    node = self
+                    children = self.children
+                    if not children:
+                        children = self.children = []
+                else:
+                    child = node_type(self.ontology, parent=node, line=self.line)
+                    child.parent = node
+                    children.append(child)
+                    stack.append((node, children))
+                    node = child
+                    children = child.children = []
+                name = True
+            elif token == closing:
+                if not stack:
+                    return i+1
+                node, children = stack.pop()
+            else:
+                child = node_type(self.ontology, parent=node, line=self.line)
+                child.symbol = token
+                child.parent = node
+                children.append(child)
+        return len(tokens)
+
+    def _child_type(self):
+        """ Returns the class of the nodes created by parse. """
+        return self.__class__
+
+    def heads(self, count):
+        """ Returns the symbols of the first count children of self. """
+        return [x.symbol for x in self.children[:count]]
+
+    def occurrences(self):
+        """ Returns the symbols of all nodes in the subtree of self with their
+        paths. The path of a symbol is the tuple of its positions in the
+        enclosing forms, the relation of a form is at position 0 and its
+        arguments are at positions 1 to n.
+
+        Returns:
+
+        - (int, (int, ...))[]
+
+        """
+        out = []
+        stack = [(self, ())]
+        while stack:
+            node, path = stack.pop()
+            children = node.children
+            if children or not path:
+                out.append((node.symbol, path + (0,)))
+                stack.extend(reversed([(child, path + (i,)) for i, child in enumerate(children, 1)]))
+            else:
+                out.append((node.symbol, path))
+        return out
+
+    def add_child(self, entry):
+        """ Adds entry as a child to self. """
+        entry.parent = self
+        self.children.append(entry)
+        self._invalidate()
+
+    def remove_child(self, entry):
+        """ Removes entry from the node's children. """
+        for i, child in enumerate(self.children):
+            if child is entry:
+                break
+        else:
+            i = self.children.index(entry)
+        child = self.children.pop(i)
+        if child.parent is self:
+            child.parent = None
+        self._invalidate()
+
+class AbstractSyntaxTree(_AbstractSyntaxTreeBase):
     """ The AbstractSyntaxTree is a node in the abstract syntax tree. The
     abstract syntax tree is defined by a root node and its children. The
     AbstractSyntaxTree is the in-memory representation of the loaded Ontologies
@@ -263,8 +1447,10 @@ class AbstractSyntaxTree:
     - parent: The parent node
     - children: A list of child nodes.
     - name: The name of the AbstractSyntaxTree object.
-    - element_type: The type of the node element.
+    - symbol: The id of name in the SymbolTable.
+    - element_type: The TokenType of name.
     - ontology: The Ontology object to which this node corresponds.
+    - span: The text a statement was parsed from and its offsets in it.
     - is_indexed: Whether or not this node is indexed.
 
     Methods:
@@ -277,64 +1463,296 @@ class AbstractSyntaxTree:
     def __init__(self, ontology, parent=None, line=-1):
         self.parent = None
         self.children = []
-        self.name = ''
-        self.element_type = ''
+        self.symbol = 0
         self.ontology = ontology
         self.line = line
+        self.span = None
+        self._hash = None
 
-    def __repr__(self):
-        if len(self.children) == 0:
-            return self.name
-        out = " ".join(["(", self.name, ""])
-        for child in self.children:
-            out = "".join([out, str(child), " "])
-        out = "".join([out, ")"])
-        return out
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['parent']
+        del state['_hash']
+        del state['span']
+        state['name'] = symbols.names[state.pop('symbol')]
+        return state
 
-    def __eq__(self, other):
-        return dumps(self) == dumps(other)
+    def __setstate__(self, state):
+        name = state.pop('name')
+        self.__dict__.update(state)
+        self.symbol = symbols.intern(name)
+        self._unpickled()
 
-    def __ne__(self, other):
-        return not self.__eq__(other)
+class CompactAbstractSyntaxTree(_AbstractSyntaxTreeBase):
+    """ A memory efficient drop-in replacement for AbstractSyntaxTree. Its
+    variables are stored in __slots__ instead of a per-node __dict__ and leaf
+    nodes share an empty tuple instead of owning an empty list of children, so
+    children must only be added with add_child. Nodes of this type are created
+    by kifparse if compact is True.
 
-    def __hash__(self):
-        return hash(dumps(self))
+    Variables:
 
-    def parse(self, tokens):
-        scip = 0
-        for i, token in enumerate(tokens):
-            if scip > 0:
-                scip -= 1
-                continue
-            if token == '(':
-                if self.name == '':
-                    self.name = tokens[i+1]
-                    scip += 1
-                else:
-                    child = AbstractSyntaxTree(self.ontology, parent=self, line=self.line)
-                    scip += child.parse(tokens[i:])
-                    scip -= 1
-                    self.add_child(child)
-            elif token == ')':
-                return i+1
+    - parent: The parent node
+    - children: A list of child nodes.
+    - name: The name of the AbstractSyntaxTree object.
+    - symbol: The id of name in the SymbolTable.
+    - element_type: The TokenType of name.
+    - ontology: The Ontology object to which this node corresponds.
+    - span: The text a statement was parsed from and its offsets in it.
+
+    """
+
+    __slots__ = ('parent', 'children', 'symbol', 'ontology', 'line', 'span', '_hash')
+
+    def __init__(self, ontology, parent=None, line=-1):
+        self.parent = None
+        self.children = ()
+        self.symbol = 0
+        self.ontology = ontology
+        self.line = line
+        self.span = None
+        self._hash = None
+
+    def __getstate__(self):
+        state = {x: getattr(self, x) for x in self.__slots__ if x not in ('parent', '_hash', 'span', 'symbol')}
+        state['name'] = self.name
+        return state
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            if key == 'name':
+                self.symbol = symbols.intern(value)
             else:
-                child = AbstractSyntaxTree(self.ontology, parent=self, line=self.line)
-                child.name = token
-                self.add_child(child)
+                setattr(self, key, value)
+        self._unpickled()
 
     def add_child(self, entry):
         """ Adds entry as a child to self. """
-        # entry.parent = self
-        self.children.append(entry)
+        if not self.children:
+            self.children = []
+        _AbstractSyntaxTreeBase.add_child(self, entry)
+
+class LazyAbstractSyntaxTree(AbstractSyntaxTree):
+    """ A top-level AbstractSyntaxTree node which keeps the tokens of its
+    form as an array of symbols and only parses them into child nodes when
+    its children are first accessed. The symbol of the node, i.e. the relation of the statement, and
+    heads are available without parsing, which is all that is needed to
+    index the statement or to match it in an AbstractGraph. Nodes of this
+    type are created by kifparse if lazy is True.
+
+    Variables:
+
+    - child_type: The class of the child nodes once they are parsed.
+
+    """
+
+    def __init__(self, ontology, parent=None, line=-1, tokens=None, child_type=AbstractSyntaxTree):
+        super(LazyAbstractSyntaxTree, self).__init__(ontology, parent=parent, line=line)
+        self.child_type = child_type
+        self._tokens = tokens
+        if tokens is not None:
+            self.symbol = tokens[1]
+
+    @property
+    def children(self):
+        """ The list of child nodes, parsed from the tokens on first access. """
+        if self._tokens is not None:
+            tokens = self._tokens
+            self._tokens = None
+            self.parse(tokens)
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._tokens = None
+        self._children = children
+
+    def _child_type(self):
+        return self.child_type
+
+    def heads(self, count):
+        """ Returns the symbols of the first count children of self. If self
+        was not parsed yet, only the tokens up to the last of these children
+        are looked at. """
+        if self._tokens is None:
+            return _AbstractSyntaxTreeBase.heads(self, count)
+        out = []
+        if count <= 0:
+            return out
+        depth = 0
+        name = False
+        tokens = self._tokens
+        opening = _OPEN
+        closing = _CLOSE
+        # Follows parse, the name of a nested form is the token after its '('
+        for i in range(2, len(tokens)):
+            token = tokens[i]
+            if name:
+                name = False
+                if depth == 1:
+                    out.append(token)
+            elif token == opening:
+                depth += 1
+                name = True
+                continue
+            elif token == closing:
+                if depth == 0:
+                    break
+                depth -= 1
+                continue
+            elif depth == 0:
+                out.append(token)
+            if len(out) == count:
+                break
+        return out
+
+    def occurrences(self):
+        """ Returns the symbols of all nodes in the subtree of self with their
+        paths as in AbstractSyntaxTree.occurrences. If self was not parsed
+        yet, the paths are computed from the tokens. """
+        if self._tokens is None:
+            return _AbstractSyntaxTreeBase.occurrences(self)
+        out = []
+        positions = []
+        opening = _OPEN
+        closing = _CLOSE
+        for token in self._tokens:
+            if token == opening:
+                positions.append(0)
+            elif token == closing:
+                if positions.pop() == 1 and positions:
+                    # Like in parse, a nested form without arguments is a leaf
+                    out[-1] = (out[-1][0], out[-1][1][:-1])
+                if not positions:
+                    break
+                positions[-1] += 1
+            else:
+                out.append((token, tuple(positions)))
+                positions[-1] += 1
+        return out
+
+    def __getstate__(self):
+        state = super(LazyAbstractSyntaxTree, self).__getstate__()
+        if self._tokens is not None:
+            state['_tokens'] = [symbols.names[x] for x in self._tokens]
+        return state
+
+    def __setstate__(self, state):
+        if state['_tokens'] is not None:
+            state['_tokens'] = array('i', map(symbols.intern, state['_tokens']))
+        super(LazyAbstractSyntaxTree, self).__setstate__(state)
+
+    def _unpickled(self):
+        self.parent = None
+        self._hash = None
+        self.span = None
+        for child in self._children:
+            child.parent = self
+
+class PartitionedAbstractSyntaxTree(AbstractSyntaxTree):
+    """ The root of the in-memory Ontology. Its statements are kept in one
+    segment per Ontology, so that adding, replacing or removing an Ontology
+    only touches the statements of that Ontology. children is the list of
+    the statements of all segments in order, it is only built when it is
+    accessed after a segment changed.
+
+    Variables:
+
+    - segments: A dict which maps every Ontology to the list of its statements.
+
+    Methods:
+
+    - statements: Iterates over the statements of all segments.
+    - set_segment: Replaces the statements of an Ontology.
+    - remove_segment: Removes the statements of an Ontology.
+
+    """
+
+    def __init__(self, ontology=None, parent=None, line=-1):
+        self.segments = dict()
+        self._children = None
+        super(PartitionedAbstractSyntaxTree, self).__init__(ontology, parent=parent, line=line)
+
+    @property
+    def children(self):
+        """ The statements of all segments, do not modify this list. """
+        if self._children is None:
+            self._children = list(self.statements())
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self.segments = dict()
+        self._children = None
+        for child in children:
+            self.segments.setdefault(child.ontology, []).append(child)
+
+    def statements(self):
+        """ Returns an iterator over the statements of all segments. """
+        return chain.from_iterable(self.segments.values())
+
+    def set_segment(self, ontology, children):
+        """ Replaces the statements of ontology with the list children. The
+        segment keeps its position if ontology already has one. """
+        for child in children:
+            child.parent = self
+        self.segments[ontology] = children
+        self._invalidate()
+
+    def remove_segment(self, ontology):
+        """ Removes the statements of ontology and returns them. """
+        children = self.segments.pop(ontology, [])
+        self._invalidate()
+        return children
+
+    def add_child(self, entry):
+        """ Adds entry to the segment of its Ontology. """
+        entry.parent = self
+        self.segments.setdefault(entry.ontology, []).append(entry)
+        self._invalidate()
 
     def remove_child(self, entry):
-        """ Removes entry from the node's children. """
-        self.children.remove(entry)
+        """ Removes entry from the segment of its Ontology. """
+        segment = self.segments.get(entry.ontology, [])
+        for i, child in enumerate(segment):
+            if child is entry:
+                break
+        else:
+            i = segment.index(entry)
+        child = segment.pop(i)
+        if child.parent is self:
+            child.parent = None
+        self._invalidate()
+
+    def _invalidate(self):
+        self._children = None
+        super(PartitionedAbstractSyntaxTree, self)._invalidate()
+
+    def __getstate__(self):
+        state = super(PartitionedAbstractSyntaxTree, self).__getstate__()
+        state['_children'] = None
+        return state
+
+def _statements(ast, ontology):
+    """ Returns the list of the top-level statements of ontology in ast. """
+    if isinstance(ast, PartitionedAbstractSyntaxTree):
+        return ast.segments.get(ontology, [])
+    return [x for x in ast.children if x.ontology == ontology]
+
+def _same_ontology(a, b):
+    return a is b or (a is not None and b is not None and a == b)
 
 class ParseError(Exception):
-    def __init__(self, line, linenumber):
+    def __init__(self, line, linenumber, column=None):
+        if isinstance(line, bytes):
+            line = line.decode('utf8', errors='replace')
+        super(ParseError, self).__init__(line, linenumber, column)
         self.line = line
         self.linnumber = linenumber
+        self.column = column
 
     def __str__(self):
-        return "".join(["Parse error in line ", str(self.linnumber), "\n", self.line])
+        if self.column is None:
+            return "".join(["Parse error in line ", str(self.linnumber), "\n", self.line])
+        return "".join(["Parse error in line ", str(self.linnumber), ", column ",
+                        str(self.column), "\n", self.line])
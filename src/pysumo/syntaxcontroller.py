@@ -11,7 +11,8 @@ This module contains:
 import logging
 
 from io import StringIO, BytesIO
-from os import listdir, fdopen, remove
+from multiprocessing import Pool
+from os import cpu_count, listdir, fdopen, remove
 from os.path import basename, isdir, join
 from pkg_resources import resource_filename
 from tempfile import mkstemp
@@ -20,6 +21,7 @@ from subprocess import Popen, PIPE, DEVNULL
 import pysumo
 from .logger import actionlog
 from . import parser
+from .astcache import ASTCache
 
 def get_ontologies(lpath=None):
     """ Returns a set of all ontologies provided by pysumo as well as local ontologies. """
@@ -34,6 +36,11 @@ def get_ontologies(lpath=None):
                 ret.add(Ontology(join(pysumo.CONFIG_PATH, f), lpath=lpath))
     return ret
 
+def _dumps_kif(kif):
+    """ Parses the kif bytes kif in a worker process and returns the AST
+    serialized with parser.astdumps. """
+    return parser.astdumps(parser.kifparse(kif, None))
+
 class SyntaxController:
     """ The high-level class containing the interface to all parsing/serialization operations.
     All operations that can modify the Ontology or kif-file are passed through the SyntaxController.
@@ -44,17 +51,38 @@ class SyntaxController:
     Methods:
 
     - parse_partial: Checks a code block for syntax errors.
+    - validate: Returns all syntax errors in a code block.
     - parse_patch: Checks a code for correctness and adds it to the Ontology.
     - add_ontology: Adds an Ontology to the in-memory Ontology.
+    - add_ontologies: Adds several Ontologies to the in-memory Ontology at once.
+    - parse_edit: Updates an Ontology in the in-memory Ontology after its kif was edited.
     - remove_ontology: Removes an Ontology from the in-memory Ontology.
     - undo: Undoes the most recent change to the ontology.
     - redo: Redoes the most recent change to the ontology.
 
+    Variables:
+
+    - parallel_size: kif files of at least this many bytes are parsed in parallel.
+
     """
 
-    def __init__(self, index):
-        """ Initializes the SyntaxController object. """
+    parallel_size = 8 * 1024 * 1024
+
+    def __init__(self, index, compact=False, cpath=None, lazy=False):
+        """ Initializes the SyntaxController object.
+
+        Arguments:
+
+        - index: the IndexAbstractor which is kept up to date
+        - compact: load Ontologies as CompactAbstractSyntaxTree nodes
+        - cpath: the directory of the AST cache
+        - lazy: load statements as LazyAbstractSyntaxTree nodes, which bypasses the AST cache
+
+        """
         self.index = index
+        self.compact = compact
+        self.lazy = lazy
+        self.cache = ASTCache(cpath)
         self.log = logging.getLogger('.' + __name__)
 
     def parse_partial(self, code_block, ontology=None):
@@ -70,10 +98,28 @@ class SyntaxController:
 
         """
         f = StringIO(code_block)
-        ast = parser.kifparse(f, ontology)
+        ast = parser.kifparse(f, ontology, compact=self.compact, lazy=self.lazy)
         f.close()
         return ast
 
+    def validate(self, code_block, ontology=None):
+        """ Checks code_block for syntactical correctness without stopping at
+        the first error, see parser.kifvalidate.
+
+        Arguments:
+
+        - code_block: the code block that will be checked
+
+        Returns:
+
+        - (AbstractSyntaxTree, list of ParseError)
+
+        """
+        f = StringIO(code_block)
+        result = parser.kifvalidate(f, ontology, compact=self.compact, lazy=self.lazy)
+        f.close()
+        return result
+
     def parse_patch(self, ontology, patch):
         """ Apply a patch to the last version of the ontology and parse this new version
 
@@ -99,14 +145,8 @@ class SyntaxController:
             pos = f.tell()
             num = ontology.action_log.queue_log(BytesIO(f.read().encode()))
             f.seek(pos)
-            newast = parser.kifparse(f, ontology, ast=self.index.root)
-        try:
-            self.remove_ontology(ontology)
-            newast = parser.astmerge((self.index.root, newast))
-        except AttributeError:
-            pass
-        newast.ontology = None
-        self.index.update_index(newast)
+            newast = parser.kifparse(f, ontology, ast=self.index.root, compact=self.compact, lazy=self.lazy)
+        self._add_asts([(ontology, newast)])
         self.index.ontologies.add(ontology)
         ontology.action_log.ok_log_item(num)
         remove(tempfilepath)
@@ -126,25 +166,135 @@ class SyntaxController:
         """
 
         if newversion == None:
-            with open(ontology.path, errors='replace') as f:
-                pos = f.tell()
-                num = ontology.action_log.queue_log(BytesIO(f.read().encode()))
-                f.seek(pos)
-                newast = parser.kifparse(f, ontology, ast=self.index.root)
+            data, num = self._read_ontology(ontology)
+            newast = None if self.lazy else self.cache.load(data, ontology, self.compact, data)
+            if newast is None:
+                processes = cpu_count() or 1 if len(data) >= self.parallel_size else 1
+                newast = parser.kifparse(data, ontology, ast=self.index.root, compact=self.compact, processes=processes, lazy=self.lazy)
+                if not self.lazy:
+                    self.cache.store(data, newast, self.compact)
         else:
-            num = ontology.action_log.queue_log(BytesIO(newversion.encode()))
-            f = StringIO(newversion)
-            newast = parser.kifparse(StringIO(newversion), ontology, ast=self.index.root)
-        try:
-            self.remove_ontology(ontology)
-            newast = parser.astmerge((self.index.root, newast))
-        except AttributeError:
-            pass
-        newast.ontology = None
-        self.index.update_index(newast)
+            data = newversion.encode()
+            num = ontology.action_log.queue_log(BytesIO(data))
+            newast = parser.kifparse(data, ontology, ast=self.index.root, compact=self.compact, lazy=self.lazy)
+        self._add_asts([(ontology, newast)])
         self.index.ontologies.add(ontology)
         ontology.action_log.ok_log_item(num)
 
+    def add_ontologies(self, ontologies, processes=None):
+        """ Adds all ontologies in the list ontologies to the current
+        in-memory Ontology. Ontologies that are not in the AST cache are
+        parsed in parallel by a pool of worker processes, the resulting ASTs
+        are merged and the index is only rebuilt once.
+
+        Arguments:
+
+        - ontologies: the ontologies that will be added
+        - processes: the number of worker processes, defaults to the number of CPUs
+
+        Raises:
+
+        - ParseError
+
+        """
+        ontologies = list(ontologies)
+        if not ontologies:
+            return
+        read = [self._read_ontology(o) for o in ontologies]
+        if self.lazy:
+            # Lazy parsing is cheaper than shipping ASTs between processes
+            asts = [parser.kifparse(data, o, compact=self.compact, lazy=True) for o, (data, _) in zip(ontologies, read)]
+        else:
+            asts = self._load_asts(ontologies, read, processes)
+        self._add_asts(zip(ontologies, asts))
+        for ontology, (_, num) in zip(ontologies, read):
+            self.index.ontologies.add(ontology)
+            ontology.action_log.ok_log_item(num)
+
+    def parse_edit(self, ontology, newversion):
+        """ Replaces ontology in the current in-memory Ontology with
+        newversion, an edited version of its kif. Only the top-level forms
+        that were changed are parsed again, if the edit spans the whole file
+        or ontology is not loaded, this is the same as add_ontology.
+
+        Arguments:
+
+        - ontology: the ontology which was edited
+        - newversion: a string witch represent the new verison of the ontology
+
+        Raises:
+
+        - ParseError
+
+        """
+        if self.index.root is None or ontology not in self.index.ontologies:
+            return self.add_ontology(ontology, newversion)
+        old = ontology.action_log.current.getvalue()
+        new = newversion.encode()
+        if old == new:
+            return
+        num = ontology.action_log.queue_log(BytesIO(new))
+        changes = []
+        if parser.kifreparse(self.index.root, ontology, old, new, self.compact, self.lazy, changes):
+            for removed, inserted in changes:
+                self.index.remove_statements(removed)
+                self.index.insert_statements(inserted)
+        else:
+            newast = parser.kifparse(new, ontology, compact=self.compact, lazy=self.lazy)
+            self._add_asts([(ontology, newast)])
+        ontology.action_log.ok_log_item(num)
+
+    def _load_asts(self, ontologies, read, processes):
+        """ Returns the ASTs of ontologies from the cache or parses them in
+        a pool of processes worker processes. """
+        asts = [self.cache.load(data, o, self.compact, data) for o, (data, _) in zip(ontologies, read)]
+        misses = [n for n, ast in enumerate(asts) if ast is None]
+        if processes is None:
+            processes = cpu_count() or 1
+        processes = min(processes, len(misses))
+        if processes > 1:
+            with Pool(processes) as pool:
+                dumps = pool.map(_dumps_kif, [read[n][0] for n in misses], chunksize=1)
+            for n, dump in zip(misses, dumps):
+                asts[n] = parser.astloads(dump, ontologies[n], self.compact, read[n][0])
+                # The workers' dumps are cached as they are
+                self.cache.store(read[n][0], dump, self.compact)
+        else:
+            for n in misses:
+                asts[n] = parser.kifparse(read[n][0], ontologies[n], compact=self.compact)
+                self.cache.store(read[n][0], asts[n], self.compact)
+        return asts
+
+    def _read_ontology(self, ontology):
+        """ Reads the kif file of ontology and queues it in its action log.
+        Returns the content of the file and the number of the queued log
+        entry. The content is parsed as it is, so the action log and the AST
+        share a single buffer. """
+        with open(ontology.path, 'rb') as f:
+            data = f.read()
+        if b'\r' in data:
+            data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        num = ontology.action_log.queue_log(BytesIO(data))
+        return data, num
+
+    def _add_asts(self, asts):
+        """ Replaces the statements of every Ontology in the in-memory
+        Ontology with the statements of its AST in the list of pairs asts.
+        Only the segments of these Ontologies are touched and only their
+        statements are indexed again, unless a new root has to be created. """
+        root = self.index.root
+        rebuild = not isinstance(root, parser.PartitionedAbstractSyntaxTree)
+        if root is None:
+            root = parser.PartitionedAbstractSyntaxTree(None)
+        elif rebuild:
+            root = parser.astmerge((root,))
+        for ontology, ast in asts:
+            root.set_segment(ontology, ast.children)
+            if not rebuild:
+                self.index.replace_ontology(ontology, ast.children)
+        if rebuild:
+            self.index.update_index(root)
+
     def remove_ontology(self, ontology):
         """ Removes ontology from the current in-memory Ontology.
 
@@ -157,31 +307,25 @@ class SyntaxController:
         - NoSuchOntologyError
 
         """
-        offset = 0
-        for n, c in enumerate(list(self.index.root.children)):
-            if c.ontology == ontology:
-                self.index.root.children.pop(n - offset)
-                offset = offset + 1
-        self.index.update_index(self.index.root)
+        self.index.root.remove_segment(ontology)
+        self.index.replace_ontology(ontology, [])
         self.index.ontologies.discard(ontology)
 
     def undo(self, ontology):
         """ Undoes the last action in ontology """
         self.log.info('Undoing change to %s' % str(ontology))
-        kif = ontology.action_log.undo().getvalue().decode('utf8')
+        kif = ontology.action_log.undo().getvalue()
         self._update_asts(ontology, kif)
 
     def redo(self, ontology):
         """ Redoes the last action in ontology """
         self.log.info('Redoing change to %s' % str(ontology))
-        kif = ontology.action_log.redo().getvalue().decode('utf8')
+        kif = ontology.action_log.redo().getvalue()
         self._update_asts(ontology, kif)
 
     def _update_asts(self, ontology, kif):
-        ast = self.parse_partial(kif, ontology)
-        self.remove_ontology(ontology)
-        newast = parser.astmerge((self.index.root, ast))
-        self.index.update_index(newast)
+        ast = parser.kifparse(kif, ontology, compact=self.compact, lazy=self.lazy)
+        self._add_asts([(ontology, ast)])
 
 class Ontology:
     """ Contains basic information about a KIF file.  This class is used to
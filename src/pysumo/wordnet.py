@@ -3,10 +3,22 @@
 This module contains:
 
 - WordNet: An interface to the WordNet online English lexical database.
+- SynsetStore: The SUMO-WordNet mapping, read from the memory-mapped mapping files on demand.
+- SynsetGraph: The hypernym hierarchy of the synsets of WordNet.
 
 """
 
-from pkg_resources import resource_stream
+import hashlib
+import logging
+import os
+
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from functools import lru_cache
+from mmap import mmap, ACCESS_READ
+from tempfile import mkstemp
+from pkg_resources import resource_filename
 
 import pysumo
 from . import parser
@@ -16,19 +28,124 @@ class WordNet:
     WordNet for information about terms in the Ontology, to find colloquial
     variations of term names and to find terms that are synonyms of a word.
 
+    Only the index of the SUMO-WordNet mapping is kept in memory, the
+    mapping files are memory-mapped and the lines of a SUMO term are parsed
+    when it is looked up. The index is stored in a binary snapshot, which is
+    loaded instead of indexing the mapping files as long as their content
+    does not change. The content is only hashed when the size or the
+    modification time of a mapping file changes.
+
+    Variables:
+
+    - default_snapshot: The default location of the snapshot.
+    - snapshot: The location of the snapshot.
+    - mapping: The SynsetStore of the SUMO-WordNet mapping.
+    - synonyms: The reverse index of mapping as returned by parser.windex.
+    - graph: The SynsetGraph of the synsets, built on first use.
+
     Methods:
 
     - locate_term: Locates a term in WordNet.
     - find_synonym: Finds possibly synonyms for a word.
+    - synsets: Returns the synsets a term is mapped to.
+    - hypernyms: Finds the SUMO terms mapped to the hypernyms of a term.
+    - hyponyms: Finds the SUMO terms mapped to the hyponyms of a term.
+    - distance: Returns the distance of two terms in the hypernym hierarchy.
+    - lowest_common_subsumers: Finds the SUMO terms mapped to the closest common hypernyms of two terms.
+    - similarity: Returns the path similarity of two terms.
 
     """
 
-    def __init__(self):
+    default_snapshot = '/'.join([pysumo.CONFIG_PATH, 'wordnet.snapshot'])
+
+    def __init__(self, snapshot=None, strict=False):
+        """ Loads the SUMO-WordNet mapping.
+
+        Args:
+
+        - snapshot: the location of the snapshot
+        - strict: validate the mapping files instead of loading the snapshot
+
+        """
+        self.snapshot = snapshot if snapshot is not None else self.default_snapshot
+        self.log = logging.getLogger('.' + __name__)
+        self.graph = None
+        self.mapping = SynsetStore(self._paths())
+        stamp = self._stamp()
+        loaded, current = (None, False) if strict else self._load(stamp)
+        if loaded is None:
+            self.mapping.index, self.synonyms = parser.windex(zip(self.mapping.files, parser.Pos), strict)
+        else:
+            self.mapping.index, self.synonyms = loaded
+        if not current:
+            self._store(stamp)
+
+    def _paths(self):
+        """ Returns the paths of the SUMO-WordNet mapping files in the order of Pos. """
+        paths = ['%s/wordnet/sdata.%s' % (pysumo.CONFIG_PATH, pos.name) for pos in parser.Pos]
+        if all(os.path.isfile(path) for path in paths):
+            return paths
+        return [resource_filename('pysumo', '/'.join(['data', 'wordnet', 'sdata.%s' % pos.name])) for pos in parser.Pos]
+
+    def _stamp(self):
+        """ Returns the first line of the snapshot, which identifies the
+        mapping files by their path, size and modification time. """
+        stats = [(path, os.stat(path)) for path in self.mapping.paths]
+        return ('%r %d\n' % ([(path, x.st_size, x.st_mtime_ns) for path, x in stats],
+                              parser.WORDNET_VERSION)).encode()
+
+    def _digest(self):
+        """ Returns the second line of the snapshot, which identifies the
+        mapping files by the SHA-256 of their content. """
+        digest = hashlib.sha256()
+        for data in self.mapping.files:
+            digest.update(data)
+        return b'%s%d\n' % (digest.hexdigest().encode(), parser.WORDNET_VERSION)
+
+    def _load(self, stamp):
+        """ Returns the index and reverse index stored in the snapshot if
+        they were created from the mapping files, otherwise None, and whether
+        the snapshot is current. The content of the mapping files is only
+        hashed if stamp, their current metadata, differs from the snapshot.
+
+        Returns:
+
+        - ((index, reverse index) or None, bool)
+
+        """
         try:
-            self.mapping = parser.wparse([(open('%s/wordnet/sdata.%s' % (pysumo.CONFIG_PATH, pos.name), 'r+b'), pos) for pos in parser.Pos])
+            with open(self.snapshot, 'rb') as f:
+                current = f.readline() == stamp
+                digest = f.readline()
+                if not current and digest != self._digest():
+                    return None, False
+                return parser.wloads(f.read()), current
         except FileNotFoundError:
-            self.mapping = parser.wparse([(resource_stream('pysumo', '/'.join(['data', 'wordnet', 'sdata.%s' % pos.name])), pos) for pos in parser.Pos])
+            return None, False
+        except Exception:
+            self.log.warning('Ignoring corrupt WordNet snapshot %s' % self.snapshot)
+            return None, False
 
+    def _store(self, stamp):
+        """ Writes the index and reverse index to the snapshot. Errors are
+        logged as the snapshot is only an optimization. """
+        tmp = None
+        try:
+            directory = os.path.dirname(self.snapshot) or '.'
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(stamp)
+                f.write(self._digest())
+                f.write(parser.wdumps(self.mapping.index, self.synonyms))
+            os.replace(tmp, self.snapshot)
+        except Exception as err:
+            self.log.warning('Could not store WordNet snapshot: %s' % err)
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
 
     def locate_term(self, term):
         """ Use the mapping from SUMO to WordNet to retrieve information about a term.
@@ -52,10 +169,366 @@ class WordNet:
         - String[]
 
         """
-        ret = set()
-        w = word.replace(' ', '_')
-        for key, value in self.mapping.items():
-            for wn_item in value:
-                if w in [x[0] for x in wn_item.synset]:
-                    ret.add(key)
-        return ret
+        return set(self.synonyms.get(word.replace(' ', '_'), ()))
+
+    def synsets(self, term):
+        """ Returns the synsets term is mapped to, read from the index
+        without parsing the lines of term.
+
+        Returns:
+
+        - (Pos, synset offset : int)[]
+
+        Raises:
+
+        - KeyError
+
+        """
+        files = self.mapping.files
+        return [parser.wsynset(files, key) for key in self.mapping.index[term]]
+
+    def _synsets(self, term):
+        """ Returns the numbers in self.graph of the synsets mapped to term.
+
+        Raises:
+
+        - KeyError
+
+        """
+        if self.graph is None:
+            mapped = {key for keys in self.mapping.index.values() for key in keys}
+            self.graph = SynsetGraph(zip(self.mapping.files, parser.Pos), mapped)
+        return {self.graph.synset_of_key(key) for key in self.mapping.index[term]}
+
+    def _terms(self, synsets):
+        """ Returns the SUMO terms mapped to synsets, synsets which are not
+        mapped to a SUMO term are skipped. """
+        keys = self.graph.keys
+        return {x.sumo_concept for synset in synsets & self.graph.mapped
+                for x in parser.wread(self.mapping.files, keys[synset])}
+
+    def hypernyms(self, term, transitive=True):
+        """ Finds the SUMO terms mapped to the hypernyms of the synsets term is mapped to.
+
+        Args:
+
+        - term: the SUMO term
+        - transitive: also find the hypernyms of the hypernyms
+
+        Returns:
+
+        - set of String
+
+        Raises:
+
+        - KeyError
+
+        """
+        synsets = self._synsets(term)
+        return self._terms(self.graph.hypernyms(synsets, transitive))
+
+    def hyponyms(self, term, transitive=True):
+        """ Finds the SUMO terms mapped to the hyponyms of the synsets term is mapped to.
+
+        Args:
+
+        - term: the SUMO term
+        - transitive: also find the hyponyms of the hyponyms
+
+        Returns:
+
+        - set of String
+
+        Raises:
+
+        - KeyError
+
+        """
+        synsets = self._synsets(term)
+        return self._terms(self.graph.hyponyms(synsets, transitive))
+
+    def distance(self, first, second):
+        """ Returns the length of the shortest path in the hypernym hierarchy
+        between the synsets first and second are mapped to, None if they do
+        not have a common hypernym.
+
+        Raises:
+
+        - KeyError
+
+        """
+        first, second = self._synsets(first), self._synsets(second)
+        return self.graph.distance(first, second)
+
+    def lowest_common_subsumers(self, first, second):
+        """ Finds the SUMO terms mapped to the common hypernyms closest to the
+        synsets first and second are mapped to.
+
+        Returns:
+
+        - set of String
+
+        Raises:
+
+        - KeyError
+
+        """
+        first, second = self._synsets(first), self._synsets(second)
+        return self._terms(self.graph.lowest_common_subsumers(first, second))
+
+    def similarity(self, first, second):
+        """ Returns the path similarity, between 0 and 1, of the synsets first
+        and second are mapped to.
+
+        Raises:
+
+        - KeyError
+
+        """
+        first, second = self._synsets(first), self._synsets(second)
+        return self.graph.similarity(first, second)
+
+class SynsetStore(Mapping):
+    """ A read-only Mapping of SUMO terms to the set of SUMOConceptWordNetItems
+    mapped to them. The SUMO-WordNet mapping files are memory-mapped and only
+    the keys of the lines of every SUMO term are kept in memory, the lines
+    are parsed with parser.wread on lookup. The items of the most recently
+    looked up SUMO terms are cached.
+
+    Variables:
+
+    - cache_size: The number of SUMO terms whose items are cached.
+    - paths: The paths of the SUMO-WordNet mapping files in the order of Pos.
+    - files: The memory-mapped SUMO-WordNet mapping files.
+    - index: The Dictionary of SUMO terms to keys returned by parser.windex.
+
+    Methods:
+
+    - close: Unmaps the SUMO-WordNet mapping files.
+
+    """
+
+    cache_size = 256
+
+    def __init__(self, paths, index=None):
+        self.paths = paths
+        self.index = index if index is not None else dict()
+        self._open()
+
+    def _open(self):
+        """ Maps the SUMO-WordNet mapping files and empties the cache. """
+        self.files = [_map(path) for path in self.paths]
+        self._lookup = lru_cache(self.cache_size)(self._read)
+
+    def _read(self, term):
+        """ Parses the lines of term. """
+        items = set()
+        for key in self.index[term]:
+            items.update(x for x in parser.wread(self.files, key) if x.sumo_concept == term)
+        return items
+
+    def __getitem__(self, term):
+        return self._lookup(term)
+
+    def __contains__(self, term):
+        return term in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getstate__(self):
+        return {'paths': self.paths, 'index': self.index}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def close(self):
+        """ Unmaps the SUMO-WordNet mapping files. """
+        self._lookup.cache_clear()
+        for data in self.files:
+            if isinstance(data, mmap):
+                data.close()
+        self.files = []
+
+def _map(path):
+    """ Returns the content of the file at path as a read-only mmap. """
+    with open(path, 'rb') as f:
+        try:
+            return mmap(f.fileno(), 0, access=ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return b''
+
+class SynsetGraph:
+    """ The hypernym hierarchy of all synsets in the SUMO-WordNet mapping
+    files. Synsets are numbered consecutively in the order of Pos and of
+    their offsets and the hypernym and hyponym pointers of every synset are
+    stored as adjacency arrays of synset numbers, so that the hierarchy can
+    be traversed without parsing the mapping files again.
+
+    Variables:
+
+    - symbols: The pointer symbols of hypernyms.
+    - keys: The keys of the lines of the synsets as in parser.windex.
+    - offsets: The synset offsets of the synsets.
+    - mapped: The numbers of the synsets mapped to SUMO terms.
+
+    Methods:
+
+    - synset: Returns the number of a synset.
+    - synset_of_key: Returns the number of the synset on a line of a mapping file.
+    - hypernyms: Returns the hypernyms of synsets.
+    - hyponyms: Returns the hyponyms of synsets.
+    - distance: Returns the length of the shortest path between two sets of synsets.
+    - lowest_common_subsumers: Returns the closest common hypernyms of two sets of synsets.
+    - similarity: Returns the path similarity of two sets of synsets.
+
+    """
+
+    symbols = ('@', '@i')
+
+    def __init__(self, datafiles, mapped=()):
+        """ Builds the hierarchy of the synsets in datafiles.
+
+        Args:
+
+        - datafiles: pairs of the SUMO-WordNet mapping files as mmap or bytes and their Pos
+        - mapped: the keys of the lines of the synsets mapped to SUMO terms as in parser.windex
+
+        """
+        self.keys = array('q')
+        self.offsets = array('q')
+        self._ranges = dict()
+        sources = array('i')
+        targets = list()
+        for data, pos in datafiles:
+            start = len(self.offsets)
+            for _, key, offset, pointers in parser.wsynsets([(data, pos)], self.symbols):
+                for pointer in pointers:
+                    sources.append(len(self.offsets))
+                    targets.append(pointer[1:])
+                self.keys.append(key)
+                self.offsets.append(offset)
+            self._ranges[pos] = (start, len(self.offsets))
+        hyponyms = array('i')
+        hypernyms = array('i')
+        for source, (pos, offset) in zip(sources, targets):
+            try:
+                hypernyms.append(self.synset(pos, offset))
+            except KeyError:
+                continue
+            hyponyms.append(source)
+        self._up = self._adjacency(hyponyms, hypernyms)
+        self._down = self._adjacency(hypernyms, hyponyms)
+        self.mapped = {self.synset_of_key(key) for key in mapped}
+
+    def _adjacency(self, sources, targets):
+        """ Returns the adjacency arrays of the edges from sources to targets. """
+        count = len(self.offsets)
+        starts = array('i', bytes(4 * (count + 1)))
+        for source in sources:
+            starts[source + 1] += 1
+        for n in range(count):
+            starts[n + 1] += starts[n]
+        edges = array('i', bytes(4 * len(targets)))
+        position = array('i', starts)
+        for source, target in zip(sources, targets):
+            edges[position[source]] = target
+            position[source] += 1
+        return starts, edges
+
+    def synset(self, pos, offset):
+        """ Returns the number of the synset at offset in the mapping file of pos.
+
+        Raises:
+
+        - KeyError
+
+        """
+        start, end = self._ranges.get(pos, (0, 0))
+        n = bisect_left(self.offsets, offset, start, end)
+        if n == end or self.offsets[n] != offset:
+            raise KeyError((pos, offset))
+        return n
+
+    def synset_of_key(self, key):
+        """ Returns the number of the synset on the line addressed by key.
+
+        Raises:
+
+        - KeyError
+
+        """
+        start, end = self._ranges.get(list(parser.Pos)[key & 3], (0, 0))
+        n = bisect_left(self.keys, key, start, end)
+        if n == end or self.keys[n] != key:
+            raise KeyError(key)
+        return n
+
+    def _closure(self, synsets, adjacency):
+        """ Returns the distance of every synset reachable from synsets. """
+        starts, edges = adjacency
+        distances = dict.fromkeys(synsets, 0)
+        frontier = list(distances)
+        distance = 0
+        while frontier:
+            distance += 1
+            reached = []
+            for synset in frontier:
+                for target in edges[starts[synset]:starts[synset + 1]]:
+                    if target not in distances:
+                        distances[target] = distance
+                        reached.append(target)
+            frontier = reached
+        return distances
+
+    def hypernyms(self, synsets, transitive=True):
+        """ Returns the numbers of the (transitive) hypernyms of synsets. """
+        starts, edges = self._up
+        direct = {x for s in synsets for x in edges[starts[s]:starts[s + 1]]}
+        if not transitive:
+            return direct
+        return set(self._closure(direct, self._up))
+
+    def hyponyms(self, synsets, transitive=True):
+        """ Returns the numbers of the (transitive) hyponyms of synsets. """
+        starts, edges = self._down
+        direct = {x for s in synsets for x in edges[starts[s]:starts[s + 1]]}
+        if not transitive:
+            return direct
+        return set(self._closure(direct, self._down))
+
+    def _common(self, first, second):
+        """ Returns the common hypernyms of first and second with the minimal
+        sum of their distances and that sum. """
+        up = self._closure(first, self._up)
+        other = self._closure(second, self._up)
+        common = dict()
+        for synset, distance in up.items():
+            if synset in other:
+                common[synset] = distance + other[synset]
+        if not common:
+            return set(), None
+        distance = min(common.values())
+        return {x for x, d in common.items() if d == distance}, distance
+
+    def distance(self, first, second):
+        """ Returns the length of the shortest path between a synset in first
+        and a synset in second through a common hypernym or None if they do
+        not have one. """
+        return self._common(first, second)[1]
+
+    def lowest_common_subsumers(self, first, second):
+        """ Returns the common hypernyms, a synset counting as its own
+        hypernym, of first and second which are closest to both. """
+        return self._common(first, second)[0]
+
+    def similarity(self, first, second):
+        """ Returns the path similarity 1 / (1 + distance) of first and
+        second or 0 if they do not have a common hypernym. """
+        distance = self.distance(first, second)
+        return 0 if distance is None else 1 / (1 + distance)
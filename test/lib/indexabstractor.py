@@ -113,6 +113,52 @@ class indexTestCase(unittest.TestCase):
         self.assertEqual(len(completions), 3228)
         milo.action_log.log_io.flush_write_queues()
 
+    def test8WordNetCoverage(self):
+        mapped, unmapped, undefined = self.indexabstractor.wordnet_coverage()
+        self.assertEqual(len(mapped['Entity']), len(self.indexabstractor.wordnet.locate_term('Entity')))
+        self.assertTrue(all(isinstance(pos, parser.Pos) and isinstance(offset, int) for pos, offset in mapped['Entity']))
+        self.assertIn('TwoDimensionalFigure', set(mapped) | unmapped)
+        self.assertFalse(set(mapped) & unmapped)
+        for term in unmapped:
+            self.assertNotIn(term, self.indexabstractor.wordnet.mapping)
+        for concept in undefined:
+            self.assertNotIn(normalize(concept), self.indexabstractor.index)
+        for concept in self.indexabstractor.wordnet.mapping:
+            self.assertTrue(concept in undefined or normalize(concept) in self.indexabstractor.index)
+
+    def test9Postings(self):
+        statement = ('( domain grasps 1 Animal )', 9479)
+        self.assertNotIn(statement, self.indexabstractor.search('Animal')[self.sumo])
+        self.assertIn(statement, self.indexabstractor.search('Animal', None)[self.sumo])
+        self.assertIn(statement, self.indexabstractor.search('Animal', 3)[self.sumo])
+        self.assertNotIn(statement, self.indexabstractor.search('Animal', 2)[self.sumo])
+        self.assertIn(statement, self.indexabstractor.search('domain', 0)[self.sumo])
+        rules = [x for x in self.indexabstractor.search('Animal', None)[self.sumo] if x[0].startswith('( =>')]
+        self.assertTrue(rules)
+        self.assertEqual(rules, [x for x in self.indexabstractor.search('animal', None)[self.sumo] if x[0].startswith('( =>')])
+        self.assertEqual(self.indexabstractor.search('instance', 1), self.indexabstractor.search('instance'))
+        with open(self.sumo.path) as f:
+            lazy = parser.kifparse(f, self.sumo, lazy=True)
+        indexabstractor = IndexAbstractor()
+        indexabstractor.update_index(lazy)
+        self.assertTrue(all(x._tokens is not None for x in lazy.children))
+        for term in ('Animal', 'instance', 'ContentBearingObject'):
+            for position in (None, 0, 1, 2):
+                self.assertEqual(indexabstractor.search(term, position), self.indexabstractor.search(term, position))
+
+    def test10PredicateIndex(self):
+        statements = self.kif.children
+        subclass = parser.symbols.find('subclass')
+        self.assertEqual(list(self.indexabstractor.predicates[subclass].values()), [x for x in statements if x.symbol == subclass])
+        self.assertEqual(sum(map(len, self.indexabstractor.arities.values())), len(statements))
+        self.assertTrue(all(len(x.children) == arity for arity, y in self.indexabstractor.arities.items() for x in y.values()))
+        for variant, major, minor in [([(0, 'subclass')], 2, 1), ([(0, 'domain'), (1, 'instance')], 1, 3), ([(2, 'Entity')], 2, 1), ([(1, 'Animal')], 2, 1), ([(1, 'instance')], 2, 1)]:
+            graph = self.indexabstractor.get_graph(variant, major, minor)
+            full = AbstractGraph(variant, major, minor, None, None, statements)
+            self.assertTrue(full.nodes)
+            self.assertEqual(graph.nodes, full.nodes)
+            self.assertEqual(graph.relations, full.relations)
+
 indexTestSuit = unittest.makeSuite(indexTestCase, 'test')
 
 if __name__ == "__main__":
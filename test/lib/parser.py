@@ -1,6 +1,7 @@
 """ The PyUnit test framework for the parser. """
 
 import atexit
+import gc
 import unittest
 import subprocess
 import pysumo
@@ -9,7 +10,9 @@ from tempfile import mkdtemp
 from shutil import rmtree
 from pysumo import parser
 from pysumo.syntaxcontroller import Ontology
-from io import StringIO
+from io import BytesIO, StringIO
+from mmap import mmap, ACCESS_READ
+from pickle import dumps, loads
 
 class wParseTestCase(unittest.TestCase):
     def test0Tokenize(self):
@@ -17,7 +20,7 @@ class wParseTestCase(unittest.TestCase):
         position = parser._wtokenize(line, parser.Pos.noun).pop()
         assert position.sumo_concept == 'Position'
         assert position.suffix == '+'
-        assert position.synset_offset == 2245555
+        assert position.synset_offset == 10495555
         assert position.lex_filenum == 18
         assert position.ss_type == parser.SSType.noun
         assert position.synset == [('pusher', None, 1), ('drug_peddler', None, 0), ('peddler', None, 1), ('drug_dealer', None, 0), ('drug_trafficker', None, 0)]
@@ -27,7 +30,76 @@ class wParseTestCase(unittest.TestCase):
 
 
     def test1Full(self):
-        parser.wparse([(open('%s/wordnet/sdata.%s' % ('src/pysumo/data', pos.name), 'r+b'), pos) for pos in parser.Pos])
+        strict = parser.wparse([(open('%s/wordnet/sdata.%s' % ('src/pysumo/data', pos.name), 'r+b'), pos) for pos in parser.Pos], strict=True)
+        mapping = parser.wparse([(open('%s/wordnet/sdata.%s' % ('src/pysumo/data', pos.name), 'r+b'), pos) for pos in parser.Pos])
+        self.assertEqual({k: len(v) for k, v in strict.items()}, {k: len(v) for k, v in mapping.items()})
+
+    def test2Snapshot(self):
+        pos = [parser.Pos.adj, parser.Pos.adv, parser.Pos.verb]
+        mapping = parser.wparse([(open('%s/wordnet/sdata.%s' % ('src/pysumo/data', p.name), 'rb'), p) for p in pos])
+        files = [b''] * len(parser.Pos)
+        for p in pos:
+            with open('%s/wordnet/sdata.%s' % ('src/pysumo/data', p.name), 'rb') as f:
+                files[list(parser.Pos).index(p)] = f.read()
+        index, synonyms = parser.windex([(files[list(parser.Pos).index(p)], p) for p in pos])
+        loaded, loaded_synonyms = parser.wloads(parser.wdumps(index, synonyms))
+        self.assertEqual(mapping.keys(), loaded.keys())
+        self.assertEqual(index, loaded)
+        self.assertEqual(synonyms, loaded_synonyms)
+        self.assertEqual({k: set(v) for k, v in synonyms.items()}, {k: set(v) for k, v in parser.wsynonyms(mapping).items()})
+        self.assertEqual(set(synonyms['good']), {key for key, items in mapping.items() if any('good' in [w[0] for w in x.synset] for x in items)})
+        def fields(items):
+            return sorted(repr((x.suffix, x.synset_offset, x.lex_filenum, x.ss_type, x.synset,
+                                x.ptr_list, x.frames and sorted(x.frames), x.gloss)) for x in items)
+        for key, items in mapping.items():
+            self.assertListEqual(fields(items), fields(x for k in loaded[key] for x in parser.wread(files, k)))
+        line = '00002098 00 a 01 unable(p) 0 002 ! 00001740 a 0101 + 05207437 n 0101 | (usually followed by `to\') not having the necessary means &%Capability+'
+        item = parser._wtokenize(line, parser.Pos.adj).pop()
+        self.assertEqual((item.sumo_concept, item.suffix, item.synset), ('Capability', '+', [('unable', 'p', 0)]))
+        with self.assertRaises(ValueError):
+            parser._wtokenize(line.replace(' | ', ' '), parser.Pos.adj)
+        data = '\n'.join([';; &%Comment', line.replace(' | ', ' '), line.replace('&%Capability', '&%Able')])
+        self.assertEqual(list(parser.wparse([(BytesIO(data.encode()), parser.Pos.adj)])), ['Able'])
+
+    def test3Records(self):
+        line = '00002098 00 a 01 unable(p) 0 002 ! 00001740 a 0101 + 05207437 n 0101 | not having the necessary means &%Capability+ &%Able='
+        first, second = parser._wtokenize(line, parser.Pos.adj)
+        self.assertIs(first.record, second.record)
+        self.assertIs(first.ptr_list, second.ptr_list)
+        self.assertFalse(hasattr(first, '__dict__'))
+        self.assertFalse(hasattr(first.record, '__dict__'))
+        verb = '00001740 29 v 01 breathe 0 002 @ 00002325 v 0000 ~ 00002573 v 0000 02 + 02 00 + 08 00 | draw air &%Breathing+'
+        shared = dict()
+        items = [parser._wtokenize(x, parser.Pos.verb, shared).pop() for x in (verb, verb.replace('00001740', '00001741'))]
+        self.assertIsNot(items[0].record, items[1].record)
+        self.assertIs(items[0].sumo_concept, items[1].sumo_concept)
+        self.assertIs(items[0].frames, items[1].frames)
+        self.assertEqual(items[0].frames, {(2, 0), (8, 0)})
+        self.assertIs(items[0].ptr_list[0], items[1].ptr_list[0])
+        self.assertEqual(loads(dumps(items[0])).ptr_list, items[0].ptr_list)
+
+
+    def test4Pointers(self):
+        pos = [parser.Pos.adj, parser.Pos.adv, parser.Pos.verb]
+        files = [b''] * len(parser.Pos)
+        for p in pos:
+            with open('%s/wordnet/sdata.%s' % ('src/pysumo/data', p.name), 'rb') as f:
+                files[list(parser.Pos).index(p)] = f.read()
+        noun = b'00001740 03 n 01 table 0 002 ~ 00002137 n 0000 @ 00001930 n 0000 | a piece of furniture &%Table+\n'
+        files[list(parser.Pos).index(parser.Pos.noun)] = noun
+        symbols = ['@', '@i', '~', '~i', '!', '&', '^', '+', '=', ';c', '-c', '\\', '<', '*', '>', '$']
+        compared = 0
+        for p, key, offset, pointers in parser.wsynsets(zip(files, parser.Pos), symbols):
+            try:
+                items = parser.wread(files, key)
+            except (ValueError, IndexError, KeyError):
+                continue
+            for item in items:
+                self.assertEqual(pointers, [x[:3] for x in item.ptr_list if x[0] in symbols])
+                compared += 1
+        self.assertGreater(compared, 10000)
+        synsets = list(parser.wsynsets(zip(files, parser.Pos), ['@']))
+        self.assertEqual(synsets[0][3], [('@', parser.Pos.noun, 1930)])
 
 
 wParseSuit = unittest.makeSuite(wParseTestCase, 'test')
@@ -90,6 +162,333 @@ class kifParseSerilizeTest(unittest.TestCase):
             break
         self.assertEqual(n.line, 199)
 
+    def test4Tokenize(self):
+        text = ('(a b) (c "d ; (e" f) ; comment "\n'
+                '; (commented out\n'
+                '(g\n'
+                '   (h "i\n'
+                '      j"))\n')
+        a = parser.kifparse(StringIO(text), None)
+        self.assertListEqual([(str(x), x.line) for x in a.children],
+                             [('( a b )', 0), ('( c "d ; (e" f )', 0),
+                              ('( g ( h "ij" ) )', 2)])
+        with self.assertRaises(parser.ParseError):
+            parser.kifparse(StringIO('(a b))'), None)
+        with self.assertRaises(parser.ParseError):
+            parser.kifparse(StringIO('(a "b)'), None)
+
+    def test5LongAxiom(self):
+        body = ''.join(['  (instance ?X%d Entity)\n' % i for i in range(5000)])
+        text = ''.join(['(=>\n (and\n', body, ' )\n (instance ?X Entity))\n'])
+        a = parser.kifparse(StringIO(text), None)
+        self.assertEqual(len(a.children), 1)
+        self.assertEqual(len(a.children[0].children[0].children), 5000)
+
+    def test6DeepNesting(self):
+        depth = 5000
+        text = ''.join(['(a ' * depth, 'b', ')' * depth])
+        node = parser.kifparse(StringIO(text), None).children[0]
+        for i in range(1, depth):
+            self.assertEqual(node.name, 'a')
+            self.assertEqual(len(node.children), 1)
+            node = node.children[0]
+        self.assertEqual(node.name, 'a')
+        self.assertEqual(node.children[0].name, 'b')
+
+    def test7Compact(self):
+        f = "src/pysumo/data/Merge.kif"
+        with open(f, errors='replace') as of:
+            a = parser.kifparse(of, None)
+        with open(f, errors='replace') as of:
+            b = parser.kifparse(of, None, compact=True)
+        self.assertIsInstance(b.children[0], parser.CompactAbstractSyntaxTree)
+        self.assertFalse(hasattr(b.children[0], '__dict__'))
+        self.assertListEqual([(str(x), x.line) for x in a.children],
+                             [(str(x), x.line) for x in b.children])
+        c = loads(dumps(b))
+        self.assertListEqual([str(x) for x in b.children], [str(x) for x in c.children])
+
+    def test8StructuralHash(self):
+        a = parser.kifparse(StringIO('(instance a Entity)\n(subclass b a)\n(instance a Entity)\n'), None)
+        first, second, third = a.children
+        self.assertEqual(first, third)
+        self.assertNotEqual(first, second)
+        self.assertEqual(hash(first), hash(third))
+        self.assertEqual(len({first, second, third}), 2)
+        old = hash(a)
+        leaf = parser.AbstractSyntaxTree(None)
+        leaf.name = 'b'
+        first.add_child(leaf)
+        self.assertNotEqual(first, third)
+        self.assertNotEqual(hash(a), old)
+        first.remove_child(leaf)
+        self.assertEqual(first, third)
+        self.assertEqual(hash(a), old)
+        c = loads(dumps(a))
+        self.assertEqual(a, c)
+        self.assertIs(c.children[0].parent, c)
+        for compact in (False, True):
+            renamed = parser.kifparse(StringIO('(instance Foo Bar)\n'), None, compact=compact)
+            expected = parser.kifparse(StringIO('(instance Foo Baz)\n'), None, compact=compact)
+            hash(renamed), hash(expected)
+            renamed.children[0].children[-1].name = 'Baz'
+            self.assertEqual(repr(renamed), repr(expected))
+            self.assertEqual(renamed, expected)
+            self.assertEqual(hash(renamed), hash(expected))
+            out = StringIO()
+            parser.kifserialize(renamed, None, out)
+            self.assertEqual(out.getvalue(), '( instance Foo Baz )\n')
+            self.assertEqual(loads(dumps(renamed)), expected)
+
+    def test9Symbols(self):
+        a = parser.kifparse(StringIO('(instance a Entity)\n(subclass b Entity)\n'), None, compact=True)
+        first = a.children[0].children[1]
+        second = a.children[1].children[1]
+        self.assertIs(first.name, second.name)
+        self.assertEqual(first.symbol, second.symbol)
+        self.assertEqual(parser.symbols.find('Entity'), first.symbol)
+        self.assertEqual(parser.symbols.names[first.symbol], 'Entity')
+        self.assertIsNone(parser.symbols.find('NoSuchSymbolInAnyOntology'))
+        first.name = 'Physical'
+        self.assertEqual(first.symbol, parser.symbols.find('Physical'))
+        c = loads(dumps(a))
+        self.assertEqual(c.children[0].children[1].symbol, first.symbol)
+        self.assertEqual(str(c), str(a))
+
+    def test10DumpLoad(self):
+        f = "src/pysumo/data/Merge.kif"
+        with open(f, errors='replace') as of:
+            a = parser.kifparse(of, None)
+        data = parser.astdumps(a)
+        for compact in (False, True):
+            b = parser.astloads(data, None, compact)
+            self.assertEqual(a, b)
+            self.assertListEqual([x.line for x in a.children], [x.line for x in b.children])
+            self.assertIs(b.children[0].children[0].parent, b.children[0])
+            self.assertIs(b.children[0].parent, b)
+        empty = parser.astloads(parser.astdumps(parser.AbstractSyntaxTree(None)), None, True)
+        self.assertListEqual(empty.children, [])
+        empty.add_child(parser.CompactAbstractSyntaxTree(None))
+        self.assertRaises(ValueError, parser.astloads, dumps((0, [], b'', b'')), None)
+        self.assertTrue(gc.isenabled())
+        gc.disable()
+        try:
+            parser.astloads(data, None)
+            self.assertFalse(gc.isenabled())
+        finally:
+            gc.enable()
+
+    def test11Parallel(self):
+        lines = ['(a "(\n', ';" )\n', '; (b\n', '(c ; "\n', ')(d)\n', '(e\n', ')\n']
+        self.assertListEqual(list(parser._form_boundaries(lines)), [0, 2, 3, 5])
+        self.assertListEqual(list(parser._form_boundaries(lines, 3)), [3, 5])
+        f = "src/pysumo/data/Merge.kif"
+        with open(f, errors='replace') as of:
+            a = parser.kifparse(of, None)
+        with open(f, errors='replace') as of:
+            b = parser.kifparse(of, None, compact=True, processes=3)
+        self.assertEqual(a, b)
+        self.assertListEqual([x.line for x in a.children], [x.line for x in b.children])
+        with open(f, errors='replace') as of:
+            kif = of.read()
+        with self.assertRaises(parser.ParseError) as cm:
+            parser.kifparse(StringIO(kif + '(instance foo\n'), None, processes=2)
+        self.assertEqual(cm.exception.linnumber, kif.count('\n') + 1)
+        for data in (b'', '', b'; only a comment\n', '(a b)\n'):
+            for compact in (False, True):
+                expected = parser.kifparse(data if isinstance(data, bytes) else StringIO(data), None, compact=compact)
+                result = parser.kifparse(data if isinstance(data, bytes) else StringIO(data), None, compact=compact, processes=2)
+                self.assertEqual(result, expected)
+                self.assertIsInstance(result, type(expected))
+
+    def test12Reparse(self):
+        old = '(a b)\n(c "d\n(e")\n; f\n(g\n h)\n(i j)\n'
+        edits = ['(a b)\n(c "d\n(e")\n; f\n(g\n k)\n(i j)\n',
+                 '(a b)\n(x y)\n(c "d\n(e")\n; f\n(g\n h)\n(i j)\n',
+                 '(a b)\n; f\n(g\n h)\n(i j)\n',
+                 '(a b)\n(c "d\n(e")\n; f\n(g\n h)\n(i j)\n(k l)\n',
+                 '(a b)\n(c "d\n(e" "\n")\n; f\n(g\n h)\n(i j)\n']
+        for new in edits:
+            other = parser.kifparse(StringIO('(other)\n'), 'other')
+            ast = parser.astmerge((parser.kifparse(StringIO(old), 'o'), other))
+            self.assertTrue(parser.kifreparse(ast, 'o', old, new))
+            full = parser.kifparse(StringIO(new), 'o')
+            self.assertListEqual(ast.children[:-1], full.children)
+            self.assertListEqual([x.line for x in ast.children[:-1]], [x.line for x in full.children])
+            self.assertIs(ast.children[-1], other.children[0])
+            self.assertIs(ast.children[1].parent, ast)
+        ast = parser.kifparse(StringIO(old), 'o')
+        self.assertFalse(parser.kifreparse(ast, 'o', old, '(x "' + old))
+        with self.assertRaises(parser.ParseError) as cm:
+            parser.kifreparse(ast, 'o', old, old.replace(' h)', ' h'))
+        self.assertEqual(cm.exception.linnumber, 5)
+        self.assertEqual(ast, parser.kifparse(StringIO(old), 'o'))
+
+    def test13Lazy(self):
+        kif = '(instance a Entity)\n(=> (f ?X) (g "h (i" ?X))\n(documentation a EnglishLanguage "j")\n'
+        a = parser.kifparse(StringIO(kif), None)
+        b = parser.kifparse(StringIO(kif), None, lazy=True)
+        for x, y in zip(a.children, b.children):
+            self.assertIsInstance(y, parser.LazyAbstractSyntaxTree)
+            self.assertEqual(x.symbol, y.symbol)
+            self.assertListEqual(x.heads(3), y.heads(3))
+            self.assertIsNotNone(y._tokens)
+        c = loads(dumps(b))
+        self.assertIsNotNone(c.children[1]._tokens)
+        self.assertEqual(a, b)
+        self.assertListEqual([x.line for x in a.children], [x.line for x in b.children])
+        self.assertIsNone(b.children[1]._tokens)
+        self.assertIs(b.children[1].children[0].parent, b.children[1])
+        self.assertEqual(str(b.children[1]), '( => ( f ?X ) ( g "h (i" ?X ) )')
+        self.assertEqual(a, c)
+        d = parser.kifparse(StringIO(kif), None, compact=True, lazy=True)
+        self.assertIsInstance(d.children[0].children[0], parser.CompactAbstractSyntaxTree)
+
+    def test14Stream(self):
+        f = "src/pysumo/data/Merge.kif"
+        with open(f, errors='replace') as of:
+            a = parser.kifparse(of, None)
+        with open(f, errors='replace') as of:
+            b = list(parser.iterkifparse(of, None))
+        self.assertListEqual(a.children, b)
+        self.assertListEqual([x.line for x in a.children], [x.line for x in b])
+        self.assertIsNone(b[0].parent)
+        consumed = []
+        def lines():
+            for line in ['(a b) (c\n', 'd)\n', '(e f)\n', ')\n']:
+                consumed.append(line)
+                yield line
+        forms = parser.iterkifparse(lines(), None)
+        self.assertEqual(str(next(forms)), '( a b )')
+        self.assertEqual(len(consumed), 1)
+        form = next(forms)
+        self.assertEqual((str(form), form.line), ('( c d )', 0))
+        self.assertEqual(len(consumed), 2)
+        self.assertEqual(next(forms).line, 2)
+        self.assertRaises(parser.ParseError, next, forms)
+
+    def test15Spans(self):
+        f = "src/pysumo/data/Merge.kif"
+        with open(f, errors='replace') as of:
+            kif = StringIO(of.read(), newline=None).getvalue()
+        a = parser.kifparse(StringIO(kif), None)
+        out = StringIO()
+        parser.kifserialize(a, None, out)
+        self.assertEqual(out.getvalue(), kif)
+        b = parser.astloads(parser.astdumps(a), None, source=kif)
+        self.assertListEqual([x.span for x in a.children], [x.span for x in b.children])
+        text = ';; header\n(a b) ; first\n\n(c\n d) ;; second\n(e f)\n'
+        a = parser.kifparse(StringIO(text), None)
+        self.assertEqual(a.children[1].span[1:], (text.index('(c'), text.index(' ;; second')))
+        leaf = parser.AbstractSyntaxTree(None)
+        leaf.name = 'g'
+        a.children[1].add_child(leaf)
+        a.remove_child(a.children[2])
+        out = StringIO()
+        parser.kifserialize(a, None, out)
+        self.assertEqual(out.getvalue(), ';; header\n(a b) ; first\n( c d g )\n')
+        new = text.replace('(e f)', '; third\n(e g)')
+        a = parser.kifparse(StringIO(text), None)
+        self.assertTrue(parser.kifreparse(a, None, text, new))
+        out = StringIO()
+        parser.kifserialize(a, None, out)
+        self.assertEqual(out.getvalue(), new)
+
+    def test16Partitioned(self):
+        kifs = ['(a b)\n(c d)\n', '(e f)\n', '(g h)\n(i j)\n']
+        asts = [parser.kifparse(StringIO(kif), n) for n, kif in enumerate(kifs)]
+        plain = parser.AbstractSyntaxTree(None)
+        for ast in asts:
+            for child in ast.children:
+                plain.add_child(child)
+        root = parser.astmerge(asts)
+        self.assertIsInstance(root, parser.PartitionedAbstractSyntaxTree)
+        self.assertEqual(root, plain)
+        self.assertListEqual(list(root.statements()), plain.children)
+        new = parser.kifparse(StringIO('(k l)\n'), 1)
+        root.set_segment(1, new.children)
+        self.assertListEqual([str(x) for x in root.children],
+                             ['( a b )', '( c d )', '( k l )', '( g h )', '( i j )'])
+        self.assertIs(root.children[2].parent, root)
+        root.remove_segment(0)
+        root.remove_child(root.children[0])
+        self.assertListEqual([str(x) for x in root.children], ['( g h )', '( i j )'])
+        self.assertTrue(parser.kifreparse(root, 2, kifs[2], '(g h)\n(i x)\n'))
+        self.assertListEqual([str(x) for x in root.segments[2]], ['( g h )', '( i x )'])
+        self.assertEqual(root, loads(dumps(root)))
+        out = StringIO()
+        parser.kifserialize(root, 2, out)
+        self.assertEqual(out.getvalue(), '(g h)\n(i x)\n')
+
+    def test17TokenTypes(self):
+        T = parser.TokenType
+        for token, kind in [('(', T.paren), (')', T.paren), ('Entity', T.symbol),
+                            ('?X', T.variable), ('@ROW', T.row_variable), ('-1.5e3', T.number),
+                            ('42', T.number), ('-', T.symbol), ('1st', T.symbol),
+                            ('"a string"', T.string), ('', None)]:
+            self.assertEqual(parser.classify(token), kind, token)
+        ast = parser.kifparse(StringIO('(=> (instance ?X Number) (p ?X 2 "s" @ROW))'), None)
+        statement = ast.children[0]
+        self.assertEqual(statement.element_type, T.symbol)
+        self.assertListEqual([x.element_type for x in statement.children[1].children],
+                             [T.variable, T.number, T.string, T.row_variable])
+        self.assertIs(parser.symbols.kinds[parser.symbols.find('?X')], T.variable)
+
+    def test18Bytes(self):
+        f = "src/pysumo/data/Merge.kif"
+        with open(f, 'rb') as of:
+            data = of.read()
+        kif = data.decode('utf8', errors='replace')
+        a = parser.kifparse(StringIO(kif), None)
+        with open(f, 'rb') as of:
+            inputs = [data, BytesIO(data), memoryview(data), of,
+                      mmap(of.fileno(), 0, access=ACCESS_READ)]
+            for infile in inputs:
+                b = parser.kifparse(infile, None)
+                self.assertEqual(a, b)
+                self.assertListEqual([x.line for x in a.children], [x.line for x in b.children])
+                # Only in-memory inputs which cannot change keep the spans of their statements
+                if isinstance(infile, (bytes, BytesIO)):
+                    out = StringIO()
+                    parser.kifserialize(b, None, out)
+                    self.assertEqual(out.getvalue(), kif)
+                else:
+                    self.assertTrue(all(x.span is None for x in b.children))
+            inputs[-1].close()
+            out = StringIO()
+            parser.kifserialize(b, None, out)
+            self.assertEqual(parser.kifparse(StringIO(out.getvalue()), None), a)
+        self.assertEqual(parser.kifparse(data, None, lazy=True), a)
+        self.assertIs(parser.symbols.intern_bytes('\u00e9t\u00e9'.encode()), parser.symbols.intern('\u00e9t\u00e9'))
+        old = b'(a b)\n; \xc3\xa9\n(c d)\n'
+        new = old.replace(b'(c d)', b'(c \xc3\xa9)')
+        b = parser.kifparse(old, None)
+        self.assertTrue(parser.kifreparse(b, None, old, new))
+        self.assertEqual(b, parser.kifparse(StringIO(new.decode()), None))
+        out = StringIO()
+        parser.kifserialize(b, None, out)
+        self.assertEqual(out.getvalue(), new.decode())
+        with self.assertRaises(parser.ParseError) as error:
+            parser.kifparse(b'(a b)\n(c \xff', None)
+        self.assertEqual(error.exception.linnumber, 2)
+
+    def test19Validate(self):
+        kif = '(a b)\nc (d e) ) (f\n  g)\n\n(h (i j)\n\n; comment\n(k "unterminated\n l)\n\n(m n) "orphan string\nmore"\n(o p))\n(q r)\n'
+        expected = [(2, 1), (2, 9), (5, 1), (8, 1), (11, 7), (13, 6)]
+        for infile in [StringIO(kif), kif.encode()]:
+            root, errors = parser.kifvalidate(infile, None)
+            self.assertListEqual([str(x) for x in root.children],
+                                 ['( a b )', '( d e )', '( f g )', '( m n )', '( o p )', '( q r )'])
+            self.assertListEqual([x.line for x in root.children], [0, 1, 1, 11, 12, 13])
+            self.assertListEqual([(x.linnumber, x.column) for x in errors], expected)
+        with self.assertRaises(parser.ParseError):
+            parser.kifparse(StringIO(kif), None)
+        with open("src/pysumo/data/Merge.kif", errors='replace') as f:
+            kif = f.read()
+        root, errors = parser.kifvalidate(StringIO(kif), None)
+        self.assertListEqual(errors, [])
+        self.assertEqual(root, parser.kifparse(StringIO(kif), None))
+
 
 kifParseSuit = unittest.makeSuite(kifParseSerilizeTest, 'test')
 
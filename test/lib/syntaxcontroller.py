@@ -1,4 +1,5 @@
 import atexit
+import os
 import unittest
 
 from copy import deepcopy
@@ -9,7 +10,7 @@ from tempfile import mkdtemp
 
 from pysumo.syntaxcontroller import *
 from pysumo.indexabstractor import IndexAbstractor
-from pysumo.parser import kifparse, AbstractSyntaxTree, astmerge
+from pysumo.parser import kifparse, AbstractSyntaxTree, LazyAbstractSyntaxTree, astmerge, ParseError
 import pysumo
 
 class syntaxTestCase(unittest.TestCase):
@@ -17,7 +18,7 @@ class syntaxTestCase(unittest.TestCase):
         self.tmpdir = mkdtemp()
         self.sumo = Ontology('src/pysumo/data/Merge.kif', name='SUMO', lpath=self.tmpdir)
         self.milo = Ontology('src/pysumo/data/MILO.kif', name='MILO', lpath=self.tmpdir)
-        self.syntaxcontroller = SyntaxController(IndexAbstractor())
+        self.syntaxcontroller = SyntaxController(IndexAbstractor(), cpath=os.path.join(self.tmpdir, 'astcache'))
         atexit.unregister(self.sumo.action_log.log_io.flush_write_queues)
         atexit.unregister(self.milo.action_log.log_io.flush_write_queues)
 
@@ -132,6 +133,140 @@ class syntaxTestCase(unittest.TestCase):
         sterm = self.syntaxcontroller.index.search('foo')
         self.assertListEqual([x[0] for x in sterm[self.sumo]], ['( instance foo Entity )', '( documentation foo EnglishLanguage "&%foo is an object of type foo" )'])
 
+    def test8ASTCache(self):
+        with open(self.milo.path, 'rb') as f:
+            data = f.read()
+        cache = self.syntaxcontroller.cache
+        self.assertIsNone(cache.load(data, self.milo))
+        self.syntaxcontroller.add_ontology(self.milo)
+        kif = cache.load(data, self.milo)
+        self.assertIsNotNone(kif)
+        self.assertIs(kif.children[0].ontology, self.milo)
+        with open(self.milo.path) as f:
+            orig = kifparse(f, self.milo)
+        self.assertEqual(kif, orig)
+        self.assertListEqual([x.line for x in kif.children], [x.line for x in orig.children])
+        self.assertIsNone(cache.load(data, self.milo, compact=True))
+        self.assertIsNone(cache.load(data + b'\n(instance foo Entity)', self.milo))
+        self.syntaxcontroller.remove_ontology(self.milo)
+        self.syntaxcontroller.add_ontology(self.milo)
+        orig.ontology = None
+        self.assertEqual(self.syntaxcontroller.index.root, orig)
+        entry = cache._entry(data, False)
+        with open(entry, 'wb') as f:
+            f.write(b'garbage')
+        self.assertIsNone(cache.load(data, self.milo))
+        self.assertFalse(os.path.exists(entry))
+        cache.max_size = 0
+        cache.store(data, orig)
+        self.assertListEqual(os.listdir(cache.path), [])
+        cache.max_size = 64 * 1024 * 1024
+        cache.store(data, object())
+        self.assertListEqual(os.listdir(cache.path), [])
+        self.assertListEqual(sorted(os.listdir(self.tmpdir)), ['MILO', 'SUMO', 'astcache'])
+
+    def test9AddOntologies(self):
+        self.syntaxcontroller.add_ontology(self.sumo)
+        self.syntaxcontroller.add_ontology(self.milo)
+        expected = self.syntaxcontroller.index.root
+        self.syntaxcontroller.cache.clear()
+        syntaxcontroller = SyntaxController(IndexAbstractor(), cpath=self.syntaxcontroller.cache.path)
+        syntaxcontroller.add_ontologies([self.sumo, self.milo], processes=2)
+        self.assertEqual(syntaxcontroller.index.root, expected)
+        self.assertListEqual([x.line for x in syntaxcontroller.index.root.children],
+                             [x.line for x in expected.children])
+        self.assertSetEqual(syntaxcontroller.index.ontologies, {self.sumo, self.milo})
+        for ontology in (self.sumo, self.milo):
+            with open(ontology.path, 'rb') as f:
+                data = f.read()
+            self.assertEqual(syntaxcontroller.cache.load(data, ontology), kifparse(data, ontology))
+        syntaxcontroller.add_ontologies([self.sumo])
+        self.assertEqual(len(syntaxcontroller.index.root.children), len(expected.children))
+        self.assertListEqual(syntaxcontroller.index.search('AbstractionFn')[self.sumo],
+                             self.syntaxcontroller.index.search('AbstractionFn')[self.sumo])
+        path = os.path.join(self.tmpdir, 'broken.kif')
+        with open(path, 'w') as f:
+            f.write('(instance foo Entity)\n(instance bar\n')
+        broken = Ontology(path, name='broken', lpath=self.tmpdir)
+        atexit.unregister(broken.action_log.log_io.flush_write_queues)
+        with self.assertRaises(ParseError) as cm:
+            syntaxcontroller.add_ontologies([broken, self.milo], processes=2)
+        self.assertEqual(cm.exception.linnumber, 2)
+        broken.action_log.log_io.flush_write_queues()
+
+    def test10ParseEdit(self):
+        self.syntaxcontroller.add_ontology(self.sumo)
+        self.syntaxcontroller.add_ontology(self.milo)
+        kif = self.syntaxcontroller.index.get_ontology_file(self.sumo).getvalue()
+        kif = kif.replace('(subclass Physical Entity)', '(instance foo Entity)\n(subclass Physical Entity)', 1)
+        self.assertIn('(instance foo Entity)', kif)
+        self.syntaxcontroller.parse_edit(self.sumo, kif)
+        expected = SyntaxController(IndexAbstractor(), cpath=self.syntaxcontroller.cache.path)
+        expected.add_ontology(self.milo)
+        expected.add_ontology(self.sumo, kif)
+        self.assertEqual(len(self.syntaxcontroller.index.root.children), len(expected.index.root.children))
+        self.assertSetEqual(set(self.syntaxcontroller.index.root.children), set(expected.index.root.children))
+        for term in ['foo', 'Entity', 'AbstractionFn']:
+            self.assertDictEqual(self.syntaxcontroller.index.search(term), expected.index.search(term))
+        self.assertEqual(self.syntaxcontroller.index.get_ontology_file(self.sumo).getvalue(), kif)
+        root = self.syntaxcontroller.index.root
+        self.assertRaises(ParseError, self.syntaxcontroller.parse_edit, self.sumo, kif.replace('(instance foo Entity)', '(instance foo Entity))'))
+        self.assertIs(self.syntaxcontroller.index.root, root)
+        self.assertDictEqual(self.syntaxcontroller.index.search('foo'), expected.index.search('foo'))
+
+    def test11Lazy(self):
+        self.syntaxcontroller.add_ontology(self.sumo)
+        syntaxcontroller = SyntaxController(IndexAbstractor(), cpath=self.syntaxcontroller.cache.path, lazy=True)
+        syntaxcontroller.add_ontology(self.sumo)
+        root = syntaxcontroller.index.root
+        self.assertIsInstance(root.children[0], LazyAbstractSyntaxTree)
+        variant = [(0, 'subclass')]
+        graph = syntaxcontroller.index.get_graph(variant, root='Entity')
+        expected = self.syntaxcontroller.index.get_graph(variant, root='Entity')
+        self.assertListEqual(graph.nodes, expected.nodes)
+        self.assertDictEqual(graph.relations, expected.relations)
+        self.assertListEqual(syntaxcontroller.index.get_completions(), self.syntaxcontroller.index.get_completions())
+        self.assertTrue(all(x._tokens is not None for x in root.children))
+        for term in ['Entity', 'AbstractionFn']:
+            self.assertDictEqual(syntaxcontroller.index.search(term), self.syntaxcontroller.index.search(term))
+        self.assertEqual(root, self.syntaxcontroller.index.root)
+
+    def test12IncrementalIndex(self):
+        index = self.syntaxcontroller.index
+        def contents(index):
+            return [{key: sorted(id(x) for x in values.values()) for key, values in table.items()}
+                    for table in (index.index, index.predicates, index.arities)] + [
+                    {key: sorted((id(x), path) for x, path in values.values()) for key, values in index.postings.items()}]
+        def check():
+            expected = IndexAbstractor()
+            expected.update_index(index.root)
+            self.assertEqual(contents(index), contents(expected))
+        generations = [index.generation]
+        self.syntaxcontroller.add_ontology(self.sumo)
+        self.syntaxcontroller.add_ontology(self.milo)
+        generations.append(index.generation)
+        check()
+        kif = index.get_ontology_file(self.sumo).getvalue()
+        edited = kif.replace('(subclass Physical Entity)', '(instance foo Entity)\n(subclass Physical Abstract)', 1)
+        root = index.root
+        self.syntaxcontroller.parse_edit(self.sumo, edited)
+        self.assertIs(index.root, root)
+        generations.append(index.generation)
+        check()
+        self.assertEqual([x[0] for x in index.search('Physical')[self.sumo] if 'Abstract' in x[0]], ['( subclass Physical Abstract )'])
+        self.syntaxcontroller.undo(self.sumo)
+        generations.append(index.generation)
+        check()
+        self.assertListEqual(index.search('foo')[self.sumo], [])
+        self.syntaxcontroller.remove_ontology(self.milo)
+        generations.append(index.generation)
+        check()
+        self.assertNotIn(self.milo, index.search('Entity'))
+        self.syntaxcontroller.add_ontology(self.milo)
+        generations.append(index.generation)
+        check()
+        self.assertEqual(generations, sorted(set(generations)))
+
 _DIFF_ADD = """
 --- dev/kit/pse/pysumo/data/Merge.kif   2015-02-12 17:07:26.991461485 +0100
 +++ test        2015-02-24 14:39:56.609460898 +0100
@@ -1,8 +1,13 @@
 """ The PyUnit test framework for the indexabstractor. """
 
+import os
+import pickle
 import unittest
 import pysumo
 
+from tempfile import mkdtemp
+from shutil import rmtree
+from pysumo import parser
 from pysumo.parser import SSType
 from pysumo.wordnet import WordNet
 
@@ -19,6 +24,90 @@ class WordNetTestCase(unittest.TestCase):
         self.assertEqual(self.wordnet.find_synonym('table'),
                 {'IntentionalProcess', 'Mesa', 'ContentDevelopment', 'Table', 'ContentBearingObject', 'Food', 'Meeting'})
 
+    def test2ReverseIndex(self):
+        for word in ['table', 'chair', 'private detective', 'no such word']:
+            expected = {key for key, items in self.wordnet.mapping.items()
+                        if any(word.replace(' ', '_') in [w[0] for w in x.synset] for x in items)}
+            self.assertEqual(self.wordnet.find_synonym(word), expected)
+
+    def test3Snapshot(self):
+        tmpdir = mkdtemp()
+        try:
+            snapshot = '/'.join([tmpdir, 'wordnet.snapshot'])
+            first = WordNet(snapshot)
+            with open(snapshot, 'rb') as f:
+                data = f.read()
+            second = WordNet(snapshot)
+            self.assertEqual(sorted(map(str, first.locate_term('Entity'))), sorted(map(str, second.locate_term('Entity'))))
+            self.assertEqual(first.synonyms, second.synonyms)
+            with open(snapshot, 'wb') as f:
+                f.write(data[:len(data) // 2])
+            third = WordNet(snapshot)
+            self.assertEqual(len(third.locate_term('Entity')), len(first.locate_term('Entity')))
+            with open(snapshot, 'rb') as f:
+                stamp = f.readline()
+                data = f.read()
+            self.assertEqual(stamp, third._stamp())
+            with open(snapshot, 'wb') as f:
+                f.write(b'stale\n' + data)
+            fourth = WordNet(snapshot)
+            self.assertEqual(fourth.synonyms, first.synonyms)
+            with open(snapshot, 'rb') as f:
+                self.assertEqual(f.read(), stamp + data)
+            blocked = '/'.join([tmpdir, 'blocked'])
+            os.mkdir(blocked)
+            fifth = WordNet(blocked)
+            self.assertEqual(len(fifth.locate_term('Entity')), len(first.locate_term('Entity')))
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['blocked', 'wordnet.snapshot'])
+        finally:
+            rmtree(tmpdir)
+
+    def test4Store(self):
+        store = self.wordnet.mapping
+        self.assertIn('Entity', store)
+        self.assertNotIn('NoSuchTerm', store)
+        with self.assertRaises(KeyError):
+            store['NoSuchTerm']
+        items = store['Entity']
+        self.assertIs(store['Entity'], items)
+        self.assertTrue(all(x.sumo_concept == 'Entity' for x in items))
+        copy = pickle.loads(pickle.dumps(self.wordnet))
+        self.assertEqual(sorted(map(str, copy.locate_term('Entity'))), sorted(map(str, self.wordnet.locate_term('Entity'))))
+        copy.mapping.close()
+        self.assertEqual(copy.mapping.files, [])
+
+    def test5Graph(self):
+        self.assertEqual(self.wordnet.graph, None)
+        self.assertIn('Walking', self.wordnet.hyponyms('Motion'))
+        graph = self.wordnet.graph
+        for key in self.wordnet.mapping.index['Walking']:
+            synset = graph.synset_of_key(key)
+            item = parser.wread(self.wordnet.mapping.files, key).pop()
+            expected = {graph.synset(pos, offset) for symbol, pos, offset, _, _ in item.ptr_list if symbol in graph.symbols}
+            self.assertEqual(graph.hypernyms({synset}, False), expected)
+            for hypernym in expected:
+                self.assertIn(synset, graph.hyponyms({hypernym}, False))
+            self.assertTrue(graph.hypernyms({synset}, False) <= graph.hypernyms({synset}))
+        self.assertTrue(self.wordnet.hypernyms('Walking', False) <= self.wordnet.hypernyms('Walking'))
+        self.assertEqual(self.wordnet.distance('Walking', 'Walking'), 0)
+        self.assertEqual(self.wordnet.similarity('Walking', 'Walking'), 1)
+        self.assertEqual(self.wordnet.distance('Walking', 'Running'), self.wordnet.distance('Running', 'Walking'))
+        self.assertIn('Walking', self.wordnet.lowest_common_subsumers('Walking', 'Motion') | self.wordnet.hyponyms('Motion'))
+        with self.assertRaises(KeyError):
+            self.wordnet.hypernyms('NoSuchTerm')
+
+    def test6Unmapped(self):
+        index = self.wordnet.mapping.index
+        files = self.wordnet.mapping.files
+        self.wordnet.hyponyms('Walking')
+        graph = self.wordnet.graph
+        self.assertEqual(graph.mapped, {graph.synset_of_key(key) for keys in index.values() for key in keys})
+        term = next(term for term, keys in index.items()
+                    if graph.hyponyms({graph.synset_of_key(key) for key in keys}, False) - graph.mapped)
+        synsets = graph.hyponyms(self.wordnet._synsets(term)) & graph.mapped
+        self.assertEqual(self.wordnet.hyponyms(term),
+                         {x.sumo_concept for synset in synsets for x in parser.wread(files, graph.keys[synset])})
+
 WNTestSuit = unittest.makeSuite(WordNetTestCase, 'test')
 
 if __name__ == "__main__":